@@ -7,8 +7,10 @@ import re
 import os, time, threading, queue
 import logging
 import stat
-from ecdsa import SigningKey
-from hashlib import sha256
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 import sys
 import platform
 import argparse
@@ -16,6 +18,9 @@ import argparse
 logging.basicConfig(level = logging.INFO,format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_HEX64_RE = re.compile(r'([0-9A-Fa-f]{64})')
+_NONHEX_RE = re.compile(r'[^0-9A-Fa-f]')
+
 def find_target_device():
     """统一的设备查找方法"""
     system = platform.system()
@@ -72,15 +77,49 @@ def parse_arguments():
     parser.add_argument('--list-ports', action='store_true', help='列出所有可用串口并退出')
     parser.add_argument('--key-file', default='debug_pkcs8.key', help='私钥文件路径')
     parser.add_argument('--timeout', type=int, default=1, help='串口超时时间(秒)')
+    parser.add_argument('--char-delay', type=float, default=0.0, help='逐字符发送间隔(秒)，默认0表示整包发送')
+    parser.add_argument('--strict-readback', action='store_true',
+                        help='盲发送模式下串口无回显时直接判定签名验证失败，不再由人工确认(默认人工确认)')
     return parser.parse_args()
 
 class SerialConnect:
-    def __init__(self, port, baudrate, timeout=1, key_file='debug_pkcs8.key'):
+    # 证书片段为常量，类加载时构建一次
+    _CERT_FRAGMENTS = (
+        "shell_cmd_SentCert 1232 1 0 60 308202643082020AA00302010202146C5837436B7B1C176EABC6B15BD711",
+        "shell_cmd_SentCert 1232 2 0 60 C0281760B9300A06082A8648CE3D04030230818F310B3009060355040613",
+        "shell_cmd_SentCert 1232 3 0 60 02434E3111300F06035504080C085368616E676861693111300F06035504",
+        "shell_cmd_SentCert 1232 4 0 60 070C085368616E676861693110300E060355040A0C07434152495A4F4E31",
+        "shell_cmd_SentCert 1232 5 0 60 0C300A060355040B0C034D43553113301106035504030C0A7169616E2E7A",
+        "shell_cmd_SentCert 1232 6 0 60 686F6E673125302306092A864886F70D01090116167169616E2E7A686F6E",
+        "shell_cmd_SentCert 1232 7 0 60 6740636172697A6F6E2E636F6D301E170D3235303432313037343935395A",
+        "shell_cmd_SentCert 1232 8 0 60 170D3335303431393037343935395A30818F310B30090603550406130243",
+        "shell_cmd_SentCert 1232 9 0 60 4E3111300F06035504080C085368616E676861693111300F06035504070C",
+        "shell_cmd_SentCert 1232 10 0 60 085368616E676861693110300E060355040A0C07434152495A4F4E310C30",
+        "shell_cmd_SentCert 1232 11 0 60 0A060355040B0C034D43553113301106035504030C0A7169616E2E7A686F",
+        "shell_cmd_SentCert 1232 12 0 60 6E673125302306092A864886F70D01090116167169616E2E7A686F6E6740",
+        "shell_cmd_SentCert 1232 13 0 60 636172697A6F6E2E636F6D3059301306072A8648CE3D020106082A8648CE",
+        "shell_cmd_SentCert 1232 14 0 60 3D03010703420004863EF095C63298BBA03C712D6C414EACE3EA1838AA0B",
+        "shell_cmd_SentCert 1232 15 0 60 EF41F0500532AA1A016B6124EDD228C634C5D849E80404F920156CD2732A",
+        "shell_cmd_SentCert 1232 16 0 60 E916D292F1479E606BD3E3D8A3423040301D0603551D0E0416041405A250",
+        "shell_cmd_SentCert 1232 17 0 60 53E47F7500163FB538EFB1F8B74F6DB5E2301F0603551D23041830168014",
+        "shell_cmd_SentCert 1232 18 0 60 DADD4DFDB56C976FD1DA55D2C4BDF41BA123797F300A06082A8648CE3D04",
+        "shell_cmd_SentCert 1232 19 0 60 030203480030450220785C165AF2ECC71B541FAA135BFB152CD01B104612",
+        "shell_cmd_SentCert 1232 20 0 60 7678CC209C25A255802693022100C20FC93E12EB01D3E30FC87AF73B0E84",
+        "shell_cmd_SentCert 1232 21 1 32 E8253CD2AD20F165B714CBA3DC2E29AE",
+    )
+    # 预编码的发送数据（含行结束符），发送时无需再编码
+    _CERT_FRAGMENTS_BYTES = tuple(fragment.encode('ascii') + b'\r\n' for fragment in _CERT_FRAGMENTS)
+
+    def __init__(self, port, baudrate, timeout=1, key_file='debug_pkcs8.key', char_delay=0.0, prompt=b'horizon:/$', strict_readback=False):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.key_file = key_file
+        self.char_delay = char_delay  # 字符间发送延迟，仅在固件需要逐字符接收时使用
+        self.prompt = prompt  # MCU shell提示符，作为响应结束标志
+        self.strict_readback = strict_readback  # 盲发送回读为空时直接失败，不由人工确认签名结果
         self._mcu_responsive = None  # MCU响应状态缓存
+        self._signing_key = None  # 私钥缓存，首次签名时加载
         
         try:
             self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
@@ -90,6 +129,28 @@ class SerialConnect:
         except Exception as e:
             logger.error(f"Failed to initialize serial: {e}")
             raise
+        
+        self._enable_low_latency()
+        self._enlarge_buffers()
+
+    def _enable_low_latency(self):
+        """开启串口低延迟模式，避免USB串口驱动的延迟定时器(FTDI默认16ms)拖慢每次交互"""
+        try:
+            # pyserial仅在Linux下实现(ASYNC_LOW_LATENCY)，其他平台抛出异常后保持默认设置
+            self.ser.set_low_latency_mode(True)
+            logger.info("Serial low latency mode enabled")
+        except Exception as e:
+            logger.warning(f"Failed to enable serial low latency mode: {e}")
+
+    def _enlarge_buffers(self):
+        """Windows下增大驱动收发缓冲区，避免一次性写入全部证书片段及读取大段输出时溢出"""
+        # set_buffer_size仅Windows版pyserial提供，其他平台无需处理
+        if not hasattr(self.ser, 'set_buffer_size'):
+            return
+        try:
+            self.ser.set_buffer_size(rx_size=65536, tx_size=65536)
+        except Exception as e:
+            logger.warning(f"Failed to set serial buffer size: {e}")
 
     def __enter__(self):
         return self
@@ -105,8 +166,18 @@ class SerialConnect:
             self.ser.close()
             self.ser = None
 
+    def _wait_tx_drain(self, nbytes):
+        """等待发送缓冲区排空，并预留按波特率计算的线上传输时间"""
+        while self.ser.out_waiting:
+            time.sleep(0.0005)
+        time.sleep(nbytes * 10 / self.baudrate * 1.1)
+
     def _send_command(self, data, read_response=True):
         """统一的命令发送方法"""
+        return self._send_raw(data.encode('utf-8', 'ignore') + b'\r\n', read_response)
+
+    def _send_raw(self, payload, read_response=True):
+        """发送已编码且带行结束符的数据"""
         if not self.isOpen():
             raise ConnectionError("Serial connection not open")
         
@@ -114,34 +185,26 @@ class SerialConnect:
             # 清空输入缓冲区
             self.ser.reset_input_buffer()
             
-            # 逐字符发送命令
-            for char in data:
-                self.ser.write(char.encode('UTF-8'))
-                time.sleep(0.01)
-            
-            self.ser.write(b'\r\n')
+            if self.char_delay:
+                # 逐字符发送命令
+                for byte in payload:
+                    self.ser.write(bytes([byte]))
+                    time.sleep(self.char_delay)
+            else:
+                # 整包发送命令
+                self.ser.write(payload)
             self.ser.flush()
             
             if not read_response:
+                self._wait_tx_drain(len(payload))
                 return True
                 
-            # 读取响应
-            time.sleep(0.2)
-            all_data = b''
-            attempts = 0
-            
-            while attempts < 3:
-                waiting_bytes = self.ser.in_waiting
-                if waiting_bytes > 0:
-                    all_data += self.ser.read(waiting_bytes)
-                    attempts = 0
-                else:
-                    attempts += 1
-                    if attempts < 3:
-                        time.sleep(0.1)
-            
-            if not all_data:
-                all_data = self.ser.read(6000)
+            # 读取响应，收到提示符即返回，否则等待至串口超时
+            if self.prompt:
+                all_data = self.ser.read_until(self.prompt, 6000)
+            else:
+                all_data = self.ser.read_until(b'\r\n', 6000)
+                all_data += self.ser.read(self.ser.in_waiting)
             
             return all_data.decode('utf-8', 'ignore')
             
@@ -178,44 +241,42 @@ class SerialConnect:
             logger.info(f"Read serial data is {result}")
         return result
 
-    def _send_cert_fragments(self, fragments, blind_mode=False):
+    def _send_cert_fragments(self, payloads, blind_mode=False):
         """统一的证书片段发送方法"""
-        for i, fragment in enumerate(fragments, 1):
+        for i, payload in enumerate(payloads, 1):
             if i % 5 == 1:
-                logger.info(f"Processing fragments {i}-{min(i+4, len(fragments))}...")
+                logger.info(f"Processing fragments {i}-{min(i+4, len(payloads))}...")
             
             try:
-                self._send_command(fragment, read_response=not blind_mode)
-                if blind_mode:
-                    time.sleep(0.8)  # 盲发送模式延迟
+                self._send_raw(payload, read_response=not blind_mode)
             except Exception as e:
                 logger.warning(f"Fragment {i} failed: {e}")
 
+    def _send_cert_fragments_bulk(self, payloads):
+        """批量证书片段发送方法 - 一次写入所有片段，MCU按行依次处理；每个片段都收到提示符时返回True"""
+        logger.info(f"Sending fragments 1-{len(payloads)} in one burst...")
+        
+        try:
+            self._send_raw(b''.join(payloads), read_response=False)
+            
+            # 每个片段处理完成后MCU输出一次提示符
+            received = 0
+            for _ in payloads:
+                if not self.ser.read_until(self.prompt or b'\r\n', 6000):
+                    break
+                received += 1
+            
+            if received < len(payloads):
+                logger.warning(f"Only {received}/{len(payloads)} fragment responses received")
+                return False
+            return True
+        except Exception as e:
+            logger.warning(f"Bulk fragment send failed: {e}")
+            return False
+
     def _get_certificate_fragments(self):
         """获取证书片段列表"""
-        return [
-            "shell_cmd_SentCert 1232 1 0 60 308202643082020AA00302010202146C5837436B7B1C176EABC6B15BD711",
-            "shell_cmd_SentCert 1232 2 0 60 C0281760B9300A06082A8648CE3D04030230818F310B3009060355040613",
-            "shell_cmd_SentCert 1232 3 0 60 02434E3111300F06035504080C085368616E676861693111300F06035504",
-            "shell_cmd_SentCert 1232 4 0 60 070C085368616E676861693110300E060355040A0C07434152495A4F4E31",
-            "shell_cmd_SentCert 1232 5 0 60 0C300A060355040B0C034D43553113301106035504030C0A7169616E2E7A",
-            "shell_cmd_SentCert 1232 6 0 60 686F6E673125302306092A864886F70D01090116167169616E2E7A686F6E",
-            "shell_cmd_SentCert 1232 7 0 60 6740636172697A6F6E2E636F6D301E170D3235303432313037343935395A",
-            "shell_cmd_SentCert 1232 8 0 60 170D3335303431393037343935395A30818F310B30090603550406130243",
-            "shell_cmd_SentCert 1232 9 0 60 4E3111300F06035504080C085368616E676861693111300F06035504070C",
-            "shell_cmd_SentCert 1232 10 0 60 085368616E676861693110300E060355040A0C07434152495A4F4E310C30",
-            "shell_cmd_SentCert 1232 11 0 60 0A060355040B0C034D43553113301106035504030C0A7169616E2E7A686F",
-            "shell_cmd_SentCert 1232 12 0 60 6E673125302306092A864886F70D01090116167169616E2E7A686F6E6740",
-            "shell_cmd_SentCert 1232 13 0 60 636172697A6F6E2E636F6D3059301306072A8648CE3D020106082A8648CE",
-            "shell_cmd_SentCert 1232 14 0 60 3D03010703420004863EF095C63298BBA03C712D6C414EACE3EA1838AA0B",
-            "shell_cmd_SentCert 1232 15 0 60 EF41F0500532AA1A016B6124EDD228C634C5D849E80404F920156CD2732A",
-            "shell_cmd_SentCert 1232 16 0 60 E916D292F1479E606BD3E3D8A3423040301D0603551D0E0416041405A250",
-            "shell_cmd_SentCert 1232 17 0 60 53E47F7500163FB538EFB1F8B74F6DB5E2301F0603551D23041830168014",
-            "shell_cmd_SentCert 1232 18 0 60 DADD4DFDB56C976FD1DA55D2C4BDF41BA123797F300A06082A8648CE3D04",
-            "shell_cmd_SentCert 1232 19 0 60 030203480030450220785C165AF2ECC71B541FAA135BFB152CD01B104612",
-            "shell_cmd_SentCert 1232 20 0 60 7678CC209C25A255802693022100C20FC93E12EB01D3E30FC87AF73B0E84",
-            "shell_cmd_SentCert 1232 21 1 32 E8253CD2AD20F165B714CBA3DC2E29AE"
-        ]
+        return self._CERT_FRAGMENTS
 
     def _extract_random_number(self, text):
         """从文本中提取随机数"""
@@ -226,14 +287,14 @@ class SerialConnect:
             random_part = text.split("Rondom numbers are:")[-1]
             
             # 正则表达式提取64位十六进制
-            match = re.search(r'([0-9A-Fa-f]{64})', random_part)
+            match = _HEX64_RE.search(random_part)
             if match:
                 random_value = match.group(1)
                 logger.info(f"Random challenge extracted: {random_value}")
                 return random_value
             
             # 手动清理方法
-            cleaned = re.sub(r'[^0-9A-Fa-f]', '', random_part)
+            cleaned = _NONHEX_RE.sub('', random_part)
             if len(cleaned) >= 64:
                 random_value = cleaned[:64]
                 logger.info(f"Random challenge extracted (cleaned): {random_value}")
@@ -256,7 +317,13 @@ class SerialConnect:
             try:
                 user_input = input(f"请输入随机数 (尝试 {attempt + 1}/3): ").strip()
                 
-                if len(user_input) == 64 and all(c in '0123456789ABCDEFabcdef' for c in user_input):
+                try:
+                    # fromhex允许字节间空白，按解码长度确认是连续的64位十六进制
+                    is_valid = len(user_input) == 64 and len(bytes.fromhex(user_input)) == 32
+                except ValueError:
+                    is_valid = False
+                
+                if is_valid:
                     logger.info(f"用户输入的随机数: {user_input}")
                     return user_input.upper()
                 else:
@@ -285,7 +352,10 @@ class SerialConnect:
         if is_responsive:
             # 响应模式：标准发送
             logger.info("Using standard mode (responsive MCU)")
-            self._send_cert_fragments(fragments[:-1])  # 前20个片段
+            if not self._send_cert_fragments_bulk(self._CERT_FRAGMENTS_BYTES[:-1]):  # 前20个片段
+                # 批量发送未收齐应答，退回逐片段发送并等待应答
+                logger.info("Falling back to per-fragment transmission...")
+                self._send_cert_fragments(self._CERT_FRAGMENTS_BYTES[:-1])
             
             # 发送最后一个片段并等待随机数
             logger.info("Sending final certificate fragment...")
@@ -303,23 +373,26 @@ class SerialConnect:
         else:
             # 非响应模式：盲发送 + 手动输入
             logger.info("Using blind mode (non-responsive MCU)")
-            self._send_cert_fragments(fragments, blind_mode=True)
+            self._send_cert_fragments(self._CERT_FRAGMENTS_BYTES, blind_mode=True)
             return self._get_random_interactive()
 
     def Gen_Signature(self, random_data):
         """生成ECDSA签名"""
         logger.info("Generating ECDSA signature...")
         
-        if not os.path.exists(self.key_file):
-            raise FileNotFoundError(f"Private key file not found: {self.key_file}")
-            
-        logger.info(f"Loading private key from: {self.key_file}")
+        if self._signing_key is None:
+            if not os.path.exists(self.key_file):
+                raise FileNotFoundError(f"Private key file not found: {self.key_file}")
+                
+            logger.info(f"Loading private key from: {self.key_file}")
+            with open(self.key_file, "rb") as f:
+                self._signing_key = load_pem_private_key(f.read(), password=None)
         
         data = bytes.fromhex(random_data)
-        with open(self.key_file, "rb") as f:
-            private_key = SigningKey.from_pem(f.read(), hashfunc=sha256)
-        
-        signature = private_key.sign(data, hashfunc=sha256)
+        # OpenSSL输出DER编码签名，MCU需要原始r||s格式
+        r, s = decode_dss_signature(self._signing_key.sign(data, ec.ECDSA(hashes.SHA256())))
+        coordinate_size = (self._signing_key.curve.key_size + 7) // 8
+        signature = r.to_bytes(coordinate_size, 'big') + s.to_bytes(coordinate_size, 'big')
         logger.info(f"Signature generated: {signature.hex()}")
         return signature
 
@@ -327,7 +400,9 @@ class SerialConnect:
         """发送签名验证 - 自适应模式"""
         logger.info("Sending signature for verification...")
         
-        # 分割签名数据
+        # 分割签名数据，分片下标依赖64字节(128位十六进制)的r||s签名
+        if len(signature) != 64:
+            raise ValueError(f"Unexpected signature length: {len(signature)} bytes, expected 64 bytes r||s")
         sig_hex = signature.hex()
         fragments = [
             f"shell_cmd_SentSignature 128 1 0 50 {sig_hex[0:50]}",
@@ -356,8 +431,28 @@ class SerialConnect:
             for i, fragment in enumerate(fragments, 1):
                 logger.info(f"Blind sending signature fragment {i}/3...")
                 self._send_command(fragment, read_response=False)
-                time.sleep(1)
             
+            # 自动回读MCU输出确认签名验证结果
+            readback = b''
+            original_timeout = self.ser.timeout
+            try:
+                self.ser.timeout = 2
+                readback = self.ser.read_until(b'Debug mode ON', 4096)
+            except Exception as e:
+                logger.warning(f"Signature readback failed: {e}")
+            finally:
+                self.ser.timeout = original_timeout
+            
+            if b'Signature Verify Ok' in readback or b'Debug mode ON' in readback:
+                logger.info("Signature verification successful!")
+                return True
+            
+            if readback.strip() or self.strict_readback:
+                logger.error("Signature verification failed!")
+                logger.info(f"Read serial data is {readback.decode('utf-8', 'ignore')}")
+                return False
+            
+            # 串口无任何输出，回退到人工确认
             logger.info("=" * 60)
             logger.info("签名片段已发送，请查看串口终端确认:")
             logger.info("   - 'Signature Verify Ok!'")
@@ -422,7 +517,8 @@ def main():
         logger.info(f"使用私钥文件: {args.key_file}")
         
         # 执行解锁流程
-        with SerialConnect(port, args.baudrate, args.timeout, args.key_file) as ser:
+        with SerialConnect(port, args.baudrate, args.timeout, args.key_file, args.char_delay,
+                           strict_readback=args.strict_readback) as ser:
             # Step 1: 读取MCU版本
             logger.info("Step 1: Reading MCU version...")
             ser.mcu_write("mcu_version_show")
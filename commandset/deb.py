@@ -3,12 +3,17 @@ import sys
 import argparse
 import json
 import importlib.util
+import functools
 import subprocess
 import os
 import shutil
 import re
+import requests
+from pathlib import Path
 from cicd.state import state_machine
 
+_SESSION = requests.Session()
+
 
 class DebianPackage():
     src_deb_dir = '/tmp'
@@ -16,19 +21,38 @@ class DebianPackage():
     download_deb_timeout = 50
     send_deb_timeout = 10
     install_deb_timeout = 10
+    ssh_control_path = '/tmp/cicd-ssh-%r@%h:%p'
+    ssh_control_persist = 10
 
     def __init__(self, logger=logging.getLogger()):
         self.logger = logger
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _load_connect_param():
+        with open(importlib.util.find_spec('cicd').submodule_search_locations[0] + "/config/device/connect_param.json", 'rb') as f:
+            return json.load(f)['ssh']
+
+    def __ssh_options(self):
+        # 复用ssh主连接，连续安装时免去重复握手
+        return ['-o', 'ControlMaster=auto',
+                '-o', f'ControlPath={self.ssh_control_path}',
+                '-o', f'ControlPersist={self.ssh_control_persist}']
+
+    def __fetch_deb(self, download_uri, deb_dir):
+        with _SESSION.get(download_uri, stream=True, timeout=self.download_deb_timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(f'{deb_dir}/{download_uri.split("/")[-1]}', 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+
     def __download_deb(self, name: str, platform: str, arch: str):
-        curdir = os.getcwd()
         apt_options=''
 
         deb_dir = f'{self.src_deb_dir}/{name}'
         if os.path.exists(deb_dir):
             shutil.rmtree(deb_dir)
         os.mkdir(deb_dir)
-        os.chdir(deb_dir)
 
         result = False
         try:
@@ -46,65 +70,58 @@ class DebianPackage():
                 debian_package_url = "unknown"
             if debian_package_url == "unknown" :
                 self.logger.debug(f'...Please confirm the platform {platform} is not support, url is {debian_package_url}')
-            packages = json.loads(subprocess.run(f'curl -s {debian_package_url}',
-                                                 shell=True,
-                                                 timeout=10,
-                                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                                 text=True, check=True).stdout)['children']
-            package_info_url = ''
-            for package in packages:
-                if len(re.findall(f'{name}.*{arch}', package['uri'])) > 0:
-                    package_info_url = debian_package_url + package['uri']
-                    break
-            if not package_info_url:
+            response = _SESSION.get(debian_package_url, timeout=10)
+            response.raise_for_status()
+            packages = response.json()['children']
+            package_pattern = re.compile(re.escape(name) + r'.*' + re.escape(arch))
+            package = next((package for package in packages if package_pattern.search(package['uri'])), None)
+            if package is None:
                 self.logger.error(f'didn\'t find {name}:{arch} in packages:\n{packages}\n')
                 raise
 
-            package_info = json.loads(subprocess.run(f'curl -s {package_info_url}',
-                                                     shell=True,
-                                                     timeout=10,
-                                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                                     text=True, check=True).stdout)
-            if 'downloadUri' not in package_info:
-                self.logger.error(f'didn\'t find downloadUri key in {name}:{arch} package info:\n{package_info}\n')
-                raise
-
-            result = subprocess.run(f'wget {package_info["downloadUri"]}',
-                                    shell=True,
-                                    timeout=self.download_deb_timeout,
-                                    text=True, check=True).returncode == 0
-
-        except subprocess.TimeoutExpired:
+            package_info_url = debian_package_url + package['uri']
+            try:
+                # storage api路径去掉api/storage即为下载地址，省去一次package info查询
+                self.__fetch_deb(package_info_url.replace('/api/storage/', '/', 1), deb_dir)
+            except requests.HTTPError as e:
+                self.logger.debug(f'failed to download {name} by storage path, query package info instead\n{e}')
+                response = _SESSION.get(package_info_url, timeout=10)
+                response.raise_for_status()
+                package_info = response.json()
+                if 'downloadUri' not in package_info:
+                    self.logger.error(f'didn\'t find downloadUri key in {name}:{arch} package info:\n{package_info}\n')
+                    raise
+
+                self.__fetch_deb(package_info['downloadUri'], deb_dir)
+            result = True
+
+        except requests.Timeout:
             self.logger.error(f'time out to download {name} deb package in {self.download_deb_timeout}s')
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f'failed to download {name} deb package, and return non-zero: {e.returncode}\n{e}')
+        except requests.RequestException as e:
+            self.logger.error(f'failed to download {name} deb package\n{e}')
         finally:
-            os.chdir(curdir)
             return result
 
-    def __push_deb_to_device(self, package_path, devinfo):
-        try:
-            return subprocess.run(f'scp {package_path} {devinfo["user"]}@{devinfo["addr"]}:{self.dst_deb_dir}',
-                                  shell=True,
-                                  timeout=self.send_deb_timeout,
-                                  text=True, check=True).returncode == 0
-        except subprocess.TimeoutExpired:
-            self.logger.error(f'time out to send {package_path} deb package to {devinfo["name"]} in {self.send_deb_timeout}s')
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f'send {package_path} deb package to {devinfo["name"]}, and return non-zero: {e.returncode}\n{e}')
-
-        return False
-
-    def __install_deb_on_device(self, name, devinfo):
+    def __install_deb_on_device(self, package_path, devinfo):
         dpkg_options = ''
+        name = os.path.basename(package_path)
+        install_timeout = self.send_deb_timeout + self.install_deb_timeout
 
         try:
-            return subprocess.run(f'ssh {devinfo["user"]}@{devinfo["addr"]} dpkg -i {dpkg_options} {self.dst_deb_dir}/{name}',
-                                  shell=True,
-                                  timeout=self.send_deb_timeout,
-                                  text=True, check=True).returncode == 0
+            # 通过ssh标准输入推送deb并在同一会话中安装，省去单独的scp
+            with open(package_path, 'rb') as deb:
+                try:
+                    return subprocess.run(['ssh', *self.__ssh_options(), f'{devinfo["user"]}@{devinfo["addr"]}',
+                                           f'cat > {self.dst_deb_dir}/{name} && dpkg -i {dpkg_options} {self.dst_deb_dir}/{name}'],
+                                          stdin=deb,
+                                          timeout=install_timeout,
+                                          check=True).returncode == 0
+                finally:
+                    # deb推送到设备后不再使用，释放其page cache(推送时仍从page cache读取)
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(deb.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
         except subprocess.TimeoutExpired:
-            self.logger.error(f'time out to install {name} deb package to {devinfo["name"]} in {self.send_deb_timeout}s')
+            self.logger.error(f'time out to install {name} deb package to {devinfo["name"]} in {install_timeout}s')
         except subprocess.CalledProcessError as e:
             self.logger.error(f'install {name} deb package to {devinfo["name"]}, and return non-zero: {e.returncode}\n{e}')
 
@@ -117,15 +134,13 @@ class DebianPackage():
             self.logger.error(f'failed to download {platform} {package} deb package to {self.src_deb_dir}/{package}/')
             return False
 
-        try:
-            package_name = subprocess.run(f'ls {self.src_deb_dir}/{package}/{package}_*.deb', shell=True,
-                                          capture_output=True, text=True, check=True).stdout.strip().split('/')[-1]
-        except FileNotFoundError as e:
-            self.logger.error(f'didn\'t find {package}_.*deb in {self.src_deb_dir}/{package}\n{e}')
+        deb_packages = list(Path(f'{self.src_deb_dir}/{package}').glob(f'{package}_*.deb'))
+        if not deb_packages:
+            self.logger.error(f'didn\'t find {package}_.*deb in {self.src_deb_dir}/{package}')
             return False
+        package_name = deb_packages[0].name
 
-        connect_param = json.loads(open(
-            importlib.util.find_spec('cicd').submodule_search_locations[0] + "/config/device/connect_param.json", 'rb').read().decode('utf-8'))['ssh']
+        connect_param = self._load_connect_param()
 
         devinfo = {
             'name': connect_param['soc']['name'],
@@ -139,11 +154,7 @@ class DebianPackage():
             self.logger.error(f'failed to get into kernel normal mode while installing debian package')
             return False
 
-        if not self.__push_deb_to_device(f'{self.src_deb_dir}/{package}/{package_name}', devinfo):
-            self.logger.error(f'failed to send {package_name} deb package to {devinfo["name"]}')
-            return False
-
-        if not self.__install_deb_on_device(package_name, devinfo):
+        if not self.__install_deb_on_device(f'{self.src_deb_dir}/{package}/{package_name}', devinfo):
             self.logger.error(f'failed to install {package_name} deb package on {devinfo["name"]}')
             return False
 
@@ -13,9 +13,107 @@ import struct
 import uuid
 import re
 import glob
+import functools
+from pathlib import Path
 from cicd.session import session
+from cicd.commandset.package_util import retry, fetch_package, extract_package
 from http import HTTPStatus
 
+_CICD_CFG_DIR = importlib.util.find_spec('cicd').submodule_search_locations[0] + '/config/device'
+_DEVICE_CONFIG_PATH = '/dev/serial/by-name/cicd-vw/device.json'
+_LTS_VERSION_RE = re.compile(r'_[Vv](\d+)\.(\d+)')
+_FASTBOOT_DEVICE_RE = re.compile(r'\b(uboot|fastboot)\b')
+
+@functools.lru_cache(maxsize=None)
+def _load_json(path: str) -> dict:
+    with open(path, 'rb') as f:
+        return json.load(f)
+
+_GPT_TYPE_MAP = {
+    uuid.UUID('C12A7328-F81F-11D2-BA4B-00A0C93EC93B'): 'PARTITION_SYSTEM_GUID',
+    uuid.UUID('024DEE41-33E7-11D3-9D69-0008C781F39F'): 'LEGACY_MBR_PARTITION_GUID',
+    uuid.UUID('E3C9E316-0B5C-4DB8-817D-F92DF00215AE'): 'PARTITION_MSFT_RESERVED_GUID',
+    uuid.UUID('EBD0A0A2-B9E5-4433-87C0-68B6B72699C7'): 'PARTITION_BASIC_DATA_GUID',
+    uuid.UUID('0FC63DAF-8483-4772-8E79-3D69D8477DE4'): 'PARTITION_LINUX_FILE_SYSTEM_DATA_GUID',
+    uuid.UUID('A19D880F-05FC-4D3B-A006-743F0F84911E'): 'PARTITION_LINUX_RAID_GUID',
+    uuid.UUID('0657FD6D-A4AB-43C4-84E5-0933C84B4F4F'): 'PARTITION_LINUX_SWAP_GUID',
+    uuid.UUID('E6D6D379-F507-44C2-A23C-238F2A3DF928'): 'PARTITION_LINUX_LVM_GUID',
+    uuid.UUID('3DE21764-95BD-54BD-A5C3-4ABE786F38A8'): 'PARTITION_U_BOOT_ENVIRONMENT',
+}
+
+# 各分区烧写超时时间(s)，按fastboot类型区分
+_PART_FLASH_TIMEOUT = {
+    "gpt": {"eth": 1 + 5, "usb": 1 + 5},  # eth: 0.026      usb: 0.039    reserve 5s for gpt backup
+    "spl_ddr_a": {"eth": 1000, "usb": 10},  # eth:       usb: 5.915
+    "spl_ddr_b": {"eth": 1000, "usb": 10},  # eth:       usb: 5.864s
+    "ubootenv": {"eth": 1000, "usb": 10},  # eth:       usb: 0.102s
+    "acore_cfg": {"eth": 1, "usb": 1},  # eth: 0.019      usb: 0.033
+    "acore_cfg_a": {"eth": 1, "usb": 1},  # eth: 0.019      usb: 0.033
+    "acore_cfg_b": {"eth": 1, "usb": 1},  # eth: 0.025      usb: 0.040
+    "bl31": {"eth": 1, "usb": 1},  # eth: 0.046      usb: 0.067
+    "bl31_a": {"eth": 1, "usb": 1},  # eth: 0.046      usb: 0.067
+    "bl31_b": {"eth": 1, "usb": 1},  # eth: 0.049      usb: 0.071
+    "optee": {"eth": 1, "usb": 1},  # eth: 0.070      usb: 0.099
+    "optee_a": {"eth": 1, "usb": 1},  # eth: 0.070      usb: 0.099
+    "optee_b": {"eth": 1, "usb": 1},  # eth: 0.074      usb: 0.104
+    "uboot": {"eth": 10, "usb": 10},  # eth: 0.109      usb: 0.140
+    "uboot_a": {"eth": 10, "usb": 10},  # eth: 0.109      usb: 0.140
+    "uboot_b": {"eth": 10, "usb": 10},  # eth: 0.107      usb: 0.150
+    "vbmeta_a": {"eth": 1, "usb": 1},  # eth: 0.048      usb: 0.077
+    "vbmeta_b": {"eth": 1, "usb": 1},  # eth: 0.051      usb: 0.082
+    "boot_a": {"eth": 10, "usb": 10},  # eth: 3.792      usb: 4.817
+    "boot_b": {"eth": 10, "usb": 10},  # eth: 3.840      usb: 4.807
+    "system_a": {"eth": 300, "usb": 500},  # eth: 146.607    usb: 312.929
+    "system_b": {"eth": 300, "usb": 500},  # eth: 147.521    usb: 312.503
+    "system_verity_a": {"eth": 5, "usb": 5},  # eth: 2.681      usb: 2.869
+    "system_verity_b": {"eth": 5, "usb": 5},  # eth: 2.717      usb: 2.885
+    "basesystem_a": {"eth": 50, "usb": 100},  # eth: 29.414     usb: 60.875
+    "basesystem_b": {"eth": 50, "usb": 100},  # eth: 29.426     usb: 61.013
+    "app_param": {"eth": 1000, "usb": 50},  # eth:       usb: 30.662s
+    "app_param_bak": {"eth": 1000, "usb": 50},  # eth:       usb: 30.466s
+    "emmc_boot1": {"eth": 1000, "usb": 10},  # eth:       usb: 4.873
+}
+
+# 超过该大小的镜像需按sparse分块下发
+_SPARSE_LIMIT = 32 * 1024 * 1024
+
+# (flash参数, 是否需要sparse)列表合并为一条命令，-S为全局选项只在所有flash子命令前给出一次，如 sudo fastboot -S 32M flash a x flash b y
+def _flash_command(fastboot_prefix, flash_batch):
+    sparse_option = "-S 32M " if any(sparse for _, sparse in flash_batch) else ""
+    return fastboot_prefix + sparse_option + " ".join(args for args, _ in flash_batch)
+
+# emmc物理分区: (partconf分区号, 是否带gpt)
+_EMMC_PARTS = {"uda": (0, True), "boot0": (1, True), "boot1": (2, False)}
+
+_GPT_HDR = struct.Struct('<8sIIIIQQQQ16sQIII')
+_GPT_ENTRY = struct.Struct('<16s16sQQQ72s')
+_HDR_FIELDS = (
+    'signature',
+    'revision',
+    'header_size',
+    'header_crc32',
+    'reserved',
+    'current_lba',
+    'backup_lba',
+    'first_usable_lba',
+    'last_usable_lba',
+    'disk_guid',
+    'partition_entries_lba',
+    'num_partition_entries',
+    'size_of_partition_entry',
+    'partition_array_crc32',
+)
+
+_ENTRY_TPL = (
+    'Partition Entry {number}:\n'
+    '  Partition Type GUID: {partition_type_guid}\n'
+    '  Unique Partition GUID: {unique_partition_guid}\n'
+    '  Starting LBA: {starting_lba}\n'
+    '  Ending LBA: {ending_lba}\n'
+    '  Attributes: {attributes}\n'
+    '  Partition Name: {name}\n'
+)
+
 class GPTParse:
     def __init__(self, image):
         self.header = {}
@@ -29,7 +127,7 @@ class GPTParse:
             f.seek(512)
 
             # 读取92字节header
-            self.header = self.__parse_header(f.read(92))
+            self.header = self.__parse_header(f.read(_GPT_HDR.size))
 
             # 跳转到partion entry部分
             f.seek(self.header['partition_entries_lba'] * 512)
@@ -54,58 +152,29 @@ class GPTParse:
             f'  Partition Array CRC32: {self.header["partition_array_crc32"]:#010x}\n'
         )
 
-        partition_entries_info = '\n'.join(
-            f'Partition Entry {number}:\n'
-            f'  Partition Type GUID: {entry["partition_type_guid"]}\n'
-            f'  Unique Partition GUID: {entry["unique_partition_guid"]}\n'
-            f'  Starting LBA: {entry["starting_lba"]}\n'
-            f'  Ending LBA: {entry["ending_lba"]}\n'
-            f'  Attributes: {entry["attributes"]}\n'
-            f'  Partition Name: {entry["name"]}\n'
+        partition_entries_info = '\n'.join([
+            _ENTRY_TPL.format(number=number, **entry)
             for number, entry in enumerate(self.partition_entries)
-        )
+        ])
 
         return header_info + '\n' + partition_entries_info + '\n'
 
 
     def __parse_header(self, header_block) -> dict:
-        header = {}
-        (
-            header['signature'],
-            header['revision'],
-            header['header_size'],
-            header['header_crc32'],
-            header['reserved'],
-            header['current_lba'],
-            header['backup_lba'],
-            header['first_usable_lba'],
-            header['last_usable_lba'],
-            header['disk_guid'],
-            header['partition_entries_lba'],
-            header['num_partition_entries'],
-            header['size_of_partition_entry'],
-            header['partition_array_crc32']
-        ) = struct.unpack('<8sIIIIQQQQ16sQIII' , header_block)
+        header = dict(zip(_HDR_FIELDS, _GPT_HDR.unpack(header_block)))
         header['disk_guid'] = uuid.UUID(bytes_le=header['disk_guid'])
         return header
 
     def __parse_partion_entries(self, f, num_partition_entries, size_of_partition_entry) -> dict:
         partition_entries = []
-        partition_attr_table = [
-            {'id': uuid.UUID('C12A7328-F81F-11D2-BA4B-00A0C93EC93B'), 'type': 'PARTITION_SYSTEM_GUID'},
-            {'id': uuid.UUID('024DEE41-33E7-11D3-9D69-0008C781F39F'), 'type': 'LEGACY_MBR_PARTITION_GUID'},
-            {'id': uuid.UUID('E3C9E316-0B5C-4DB8-817D-F92DF00215AE'), 'type': 'PARTITION_MSFT_RESERVED_GUID'},
-            {'id': uuid.UUID('EBD0A0A2-B9E5-4433-87C0-68B6B72699C7'), 'type': 'PARTITION_BASIC_DATA_GUID'},
-            {'id': uuid.UUID('0FC63DAF-8483-4772-8E79-3D69D8477DE4'), 'type': 'PARTITION_LINUX_FILE_SYSTEM_DATA_GUID'},
-            {'id': uuid.UUID('A19D880F-05FC-4D3B-A006-743F0F84911E'), 'type': 'PARTITION_LINUX_RAID_GUID'},
-            {'id': uuid.UUID('0657FD6D-A4AB-43C4-84E5-0933C84B4F4F'), 'type': 'PARTITION_LINUX_SWAP_GUID'},
-            {'id': uuid.UUID('E6D6D379-F507-44C2-A23C-238F2A3DF928'), 'type': 'PARTITION_LINUX_LVM_GUID'},
-            {'id': uuid.UUID('3DE21764-95BD-54BD-A5C3-4ABE786F38A8'), 'type': 'PARTITION_U_BOOT_ENVIRONMENT'}
-        ]
-
-        for _ in range(num_partition_entries):
-            entry_data = f.read(size_of_partition_entry)
-            if entry_data.strip(b'\x00'):
+
+        # 一次读取整个partition entry表，避免逐条read
+        entries_data = f.read(num_partition_entries * size_of_partition_entry)
+        # 空entry直接与全零块比较(memcmp)，不再逐条切片拷贝后strip
+        entries_view = memoryview(entries_data)
+        empty_entry = bytes(size_of_partition_entry)
+        for offset in range(0, len(entries_data) - size_of_partition_entry + 1, size_of_partition_entry):
+            if entries_view[offset:offset + size_of_partition_entry] != empty_entry:
                 partition_entry = {}
                 (
                     partition_entry['partition_type_guid'],
@@ -114,73 +183,72 @@ class GPTParse:
                     partition_entry['ending_lba'],
                     partition_entry['attributes'],
                     partition_entry['name']
-                ) = struct.unpack('<16s16sQQQ72s', entry_data)
+                ) = _GPT_ENTRY.unpack_from(entries_data, offset)
                 partition_entry['partition_type_guid'] = uuid.UUID(bytes_le=partition_entry['partition_type_guid'])
-                for entry_type in partition_attr_table:
-                    if partition_entry['partition_type_guid'] == entry_type['id']:
-                        partition_entry['partition_type_guid'] = f'{partition_entry["partition_type_guid"]} ({entry_type["type"]})'
-                        break
-                else:
-                    partition_entry['partition_type_guid'] = f'{partition_entry["partition_type_guid"]} (Unknown)'
+                partition_type = _GPT_TYPE_MAP.get(partition_entry['partition_type_guid'], 'Unknown')
+                partition_entry['partition_type_guid'] = f'{partition_entry["partition_type_guid"]} ({partition_type})'
 
                 partition_entry['unique_partition_guid'] = uuid.UUID(bytes_le=partition_entry['unique_partition_guid'])
-                partition_entry['name'] = partition_entry['name'].decode('utf-16').rstrip('\x00')
+                # GPT分区名固定为无BOM的utf-16-le，以NUL结尾
+                partition_entry['name'] = partition_entry['name'].decode('utf-16-le', 'ignore').split('\x00', 1)[0]
                 partition_entries.append(partition_entry)
         return partition_entries
 
 class Fastboot:
     img_packages=os.path.abspath(f'/tmp/img_packages')
     download_timeout=600 # real    2m6.818s
-    target_ipaddr = json.loads(open(importlib.util.find_spec('cicd').submodule_search_locations[0] + "/config/device/connect_param.json", "rb").read().decode("utf-8"))["ssh"]["soc"]["addr"]
+    target_ipaddr = _load_json(f'{_CICD_CFG_DIR}/connect_param.json')["ssh"]["soc"]["addr"]
     fastboot_options = {"eth": f"-s udp:{target_ipaddr}:5554 ", "usb": f""}
-    board_config: dict = json.loads(
-        open(
-            f"{importlib.util.find_spec('cicd').submodule_search_locations[0]}/config/device/board.json",
-            "rb",
-        )
-        .read()
-        .decode("utf-8")
-    )
-    device_config: dict = json.loads(
-        open("/dev/serial/by-name/cicd-vw/device.json", "rb").read().decode("utf-8")
-    )
     def __init__(self, logger=logging.getLogger()):
         self.logger = logger
 
+    # 配置文件在首次使用时才读取(_load_json已缓存)，文件不存在时返回空配置，避免import时失败
+    @classmethod
+    def _board_config(cls) -> dict:
+        try:
+            return _load_json(f'{_CICD_CFG_DIR}/board.json')
+        except OSError:
+            return {}
+
+    @classmethod
+    def _device_config(cls) -> dict:
+        try:
+            return _load_json(_DEVICE_CONFIG_PATH)
+        except OSError:
+            return {}
+
     def __connect_target(self, fastboot_type):
         max_retry_times = 20 # 防止因交换机路由表导致设置ip后网络不通
         if fastboot_type == 'eth':
-            connect_cmd = f'ping {self.target_ipaddr} -c 1 -W 1'
+            connect_cmd = ['ping', self.target_ipaddr, '-c', '1', '-W', '1']
         elif fastboot_type == 'usb':
-            connect_cmd = f'sudo fastboot devices | grep -E "uboot|fastboot"'
-
-        for retry_times in range(max_retry_times):
-            try:
-                subprocess.run(
-                    connect_cmd,
-                    shell=True,
-                    timeout=1,
-                    text=True,
-                    check=True
-                )
-                self.logger.debug(f'connected target by {fastboot_type}')
-                return True
-            except Exception as e:
-                retry_times += 1
-                self.logger.warning(
-                    f"try to connect target by {fastboot_type} but failed\n{e}"
-                )
-        else:
-            self.logger.error(f"failed to connect target in {max_retry_times}s")
+            connect_cmd = ['sudo', 'fastboot', 'devices']
+
+        def __connect():
+            result = subprocess.run(
+                connect_cmd,
+                capture_output=True,
+                timeout=1,
+                text=True,
+                check=True
+            )
+            # 直接在输出中匹配设备，无需再起shell和grep进程
+            if fastboot_type == 'usb' and not _FASTBOOT_DEVICE_RE.search(result.stdout):
+                raise RuntimeError(f'no fastboot device found in:\n{result.stdout}')
+            return True
+
+        if not retry(self.logger, max_retry_times, __connect, f'connect target by {fastboot_type}'):
             return False
+        self.logger.debug(f'connected target by {fastboot_type}')
+        return True
 
     def __get_host_name(self):
-        return self.device_config.get("hostname")
+        return self._device_config().get("hostname")
 
     def __download_package(self, module, url, host_name):
         def __get_latest_package_info(module, host_name) -> str:
             jfrog_api_prefix = "https://jfrog.carizon.work/artifactory/api/storage/project-snapshot-local"
-            package_path = self.board_config.get(host_name, None)
+            package_path = self._board_config().get(host_name, None)
 
             if package_path == None:
                 self.logger.error(f"no specified update packge path for {host_name}")
@@ -201,12 +269,15 @@ class Fastboot:
                 return False
 
             latest_package_size = int(response.json()['size'])
-            latest_package_md5 = response.json()['checksums']['md5']
+            # 优先使用sha256校验(可走硬件SHA指令)，没有时退回md5
+            checksums = response.json()['checksums']
+            latest_package_hash_name = 'sha256' if checksums.get('sha256') else 'md5'
+            latest_package_hash = checksums[latest_package_hash_name]
             latest_package_url = response.json()['downloadUri']
             self.logger.debug(f'latest bsp package url: {latest_package_url}')
-            return latest_package_url, latest_package_size, latest_package_md5
+            return latest_package_url, latest_package_size, latest_package_hash_name, latest_package_hash
 
-        def __check_latest_package(latest_package_size, latest_package_md5) -> bool:
+        def __check_latest_package(cur_hash, latest_package_size, latest_package_hash_name, latest_package_hash) -> bool:
             # 文件大小判断
             cur_size = os.path.getsize(f'{package_path}')
             if cur_size != latest_package_size:
@@ -214,64 +285,50 @@ class Fastboot:
                 return False
             self.logger.debug(f'bsp package size validate pass')
 
-            # 文件完整性判断
-            md5 = hashlib.md5()
-            with open(f'{package_path}', 'rb') as file:
-                for chunk in iter(lambda: file.read(1024 * 1024), b''):
-                    md5.update(chunk)
-            cur_md5 = md5.hexdigest()
-            if cur_md5 != latest_package_md5:
-                self.logger.error(f'invalid bsp package md5, actual: {cur_md5}, expect: {latest_package_md5}')
+            # 文件完整性判断，摘要已在下载过程中计算
+            if cur_hash != latest_package_hash:
+                self.logger.error(f'invalid bsp package {latest_package_hash_name}, actual: {cur_hash}, expect: {latest_package_hash}')
                 return False
-            self.logger.debug(f'bsp package md5 validate pass')
+            self.logger.debug(f'bsp package {latest_package_hash_name} validate pass')
 
             return True
 
         if url == 'latest':
-            package_url, package_size, package_md5 = __get_latest_package_info(
-                module, host_name
+            package_info = retry(
+                self.logger, 5, lambda: __get_latest_package_info(module, host_name), 'query latest bsp package info',
+                backoff=True,
             )
+            if not package_info:
+                return False, '', ''
+            package_url, package_size, package_hash_name, package_hash = package_info
         else:
             package_url = url
+            package_hash_name = 'sha256'
 
         package_name = package_url.split('/')[-1]
         package_dir = '/tmp'
         package_path = f'{package_dir}/{package_name}'
 
-        # 下载最新的升级包
-        cur_pwd = os.getcwd()
-        os.chdir(package_dir)
-        max_retry_times = 10
-        for retry_times in range(max_retry_times):
-            try:
-                subprocess.run(
-                    f'wget -c --tries=10 --retry-connrefused --timeout=30 --waitretry=10 {package_url}',
-                    shell=True,
-                    timeout=self.download_timeout,
-                    text=True,
-                    check=True
-                )
-                self.logger.debug(f'succeed download latest bsp package {package_path}')
-                break
-            except Exception as e:
-                retry_times += 1
-                self.logger.warning(f'failed to download {package_name} for {retry_times} times\n{e}')
-                if os.path.exists(f'{package_path}'):
-                    os.remove(f'{package_path}')
-        else:
-            os.chdir(cur_pwd)
-            self.logger.error(
-                f"failed download latest bsp package after retry {max_retry_times} times"
-            )
-            return False, ""
-
-        os.chdir(cur_pwd)
+        # 下载最新的升级包，摘要仅用于校验而非安全用途
+        new_hash = functools.partial(hashlib.new, package_hash_name, usedforsecurity=False)
+        cur_hash = retry(
+            self.logger,
+            10,
+            lambda: fetch_package(requests.get, package_url, package_path, new_hash, self.download_timeout),
+            f'download {package_name}',
+            backoff=True,
+        )
+        if not cur_hash:
+            return False, "", ""
+        self.logger.debug(f'succeed download latest bsp package {package_path}')
 
-        if url == 'latest' and not __check_latest_package(package_size, package_md5):
+        if url == 'latest' and not __check_latest_package(cur_hash, package_size, package_hash_name, package_hash):
             self.logger.error(f'download latest package but check failed')
-            return False, ''
+            # 删除校验失败的包，避免下次续传到损坏的文件上
+            os.remove(package_path)
+            return False, '', ''
 
-        return True, package_path
+        return True, package_path, f'{package_hash_name}:{cur_hash}'
 
     def __device_run_fastboot(self, fastboot_type):
         if fastboot_type == 'usb':
@@ -296,139 +353,57 @@ class Fastboot:
         return result
 
     def __host_run_fastboot(self, fastboot_type, host_name):
+        fastboot_prefix = f"sudo fastboot {self.fastboot_options[fastboot_type]}"
+
         def __host_run_fastboot_format_init_command(
             module, devnum=0, part="uda"
-        ) -> list | bool:
-            emmc_num_dict = {
-                "uda": {"partnum": 0, "has_gpt": True},
-                "boot0": {"partnum": 1, "has_gpt": True},
-                "boot1": {"partnum": 2, "has_gpt": False},
-            }
-            fastboot_start_command_table = {
-                "soc": [
-                    {
-                        "content": f"sudo fastboot {self.fastboot_options[fastboot_type]}oem interface:blk",
-                        "timeout": 1,
-                    },  # eth: 0.000      usb: 0.002
-                    {
-                        "content": f"sudo fastboot {self.fastboot_options[fastboot_type]}oem bootdevice:mmc",
-                        "timeout": 1,
-                    },  # eth: 0.000      usb: 0.002
-                    {
-                        "content": f"sudo fastboot {self.fastboot_options[fastboot_type]}oem runcommand:mmc partconf {devnum} 1 1 {emmc_num_dict.get(part)['partnum']}",
-                        "timeout": 1,
-                    },  # eth: 0.000      usb: 0.002
-                ],
-                "mcu": [
+        ) -> tuple:
+            if module == "mcu":
+                return [
                     {
-                        "content": f"sudo fastboot {self.fastboot_options[fastboot_type]}oem interface:mtd",
+                        "content": f"{fastboot_prefix}oem interface:mtd",
                         "timeout": 1,
                     },  # eth: 0.000      usb: 0.002
-                ],
-            }
+                ], True
 
-            has_gpt = None
-            if module == "soc":
-                has_gpt = emmc_num_dict.get(part)["has_gpt"]
-            elif module == "mcu":
-                has_gpt = True
-
-            return fastboot_start_command_table[module], has_gpt
+            partnum, has_gpt = _EMMC_PARTS[part]
+            return [
+                {
+                    "content": f"{fastboot_prefix}oem interface:blk",
+                    "timeout": 1,
+                },  # eth: 0.000      usb: 0.002
+                {
+                    "content": f"{fastboot_prefix}oem bootdevice:mmc",
+                    "timeout": 1,
+                },  # eth: 0.000      usb: 0.002
+                {
+                    "content": f"{fastboot_prefix}oem runcommand:mmc partconf {devnum} 1 1 {partnum}",
+                    "timeout": 1,
+                },  # eth: 0.000      usb: 0.002
+            ], has_gpt
+
+        # 各介质的烧写前置命令只构建一次，供所有分区复用
+        medium_init_commands = {
+            "emmc": __host_run_fastboot_format_init_command("soc", part="uda"),
+            "emmc_boot0": __host_run_fastboot_format_init_command("soc", part="boot0"),
+            "emmc_boot1": __host_run_fastboot_format_init_command("soc", part="boot1"),
+            "nor": __host_run_fastboot_format_init_command("mcu"),
+        }
 
         def __host_run_fastboot_format_flash_command() -> list:
-            partition_flash_attribute = {
-                "gpt": {
-                    "timeout": {"eth": 1 + 5, "usb": 1 + 5}
-                },  # eth: 0.026      usb: 0.039    reserve 5s for gpt backup
-                "spl_ddr_a": {
-                    "timeout": {"eth": 1000, "usb": 10}
-                },  # eth:       usb: 5.915
-                "spl_ddr_b": {
-                    "timeout": {"eth": 1000, "usb": 10}
-                },  # eth:       usb: 5.864s
-                "ubootenv": {
-                    "timeout": {"eth": 1000, "usb": 10}
-                },  # eth:       usb: 0.102s
-                "acore_cfg": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.019      usb: 0.033
-                "acore_cfg_a": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.019      usb: 0.033
-                "acore_cfg_b": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.025      usb: 0.040
-                "bl31": {"timeout": {"eth": 1, "usb": 1}},  # eth: 0.046      usb: 0.067
-                "bl31_a": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.046      usb: 0.067
-                "bl31_b": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.049      usb: 0.071
-                "optee": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.070      usb: 0.099
-                "optee_a": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.070      usb: 0.099
-                "optee_b": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.074      usb: 0.104
-                "uboot": {
-                    "timeout": {"eth": 10, "usb": 10}
-                },  # eth: 0.109      usb: 0.140
-                "uboot_a": {
-                    "timeout": {"eth": 10, "usb": 10}
-                },  # eth: 0.109      usb: 0.140
-                "uboot_b": {
-                    "timeout": {"eth": 10, "usb": 10}
-                },  # eth: 0.107      usb: 0.150
-                "vbmeta_a": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.048      usb: 0.077
-                "vbmeta_b": {
-                    "timeout": {"eth": 1, "usb": 1}
-                },  # eth: 0.051      usb: 0.082
-                "boot_a": {
-                    "timeout": {"eth": 10, "usb": 10}
-                },  # eth: 3.792      usb: 4.817
-                "boot_b": {
-                    "timeout": {"eth": 10, "usb": 10}
-                },  # eth: 3.840      usb: 4.807
-                "system_a": {
-                    "timeout": {"eth": 300, "usb": 500}
-                },  # eth: 146.607    usb: 312.929
-                "system_b": {
-                    "timeout": {"eth": 300, "usb": 500}
-                },  # eth: 147.521    usb: 312.503
-                "system_verity_a": {
-                    "timeout": {"eth": 5, "usb": 5}
-                },  # eth: 2.681      usb: 2.869
-                "system_verity_b": {
-                    "timeout": {"eth": 5, "usb": 5}
-                },  # eth: 2.717      usb: 2.885
-                "basesystem_a": {
-                    "timeout": {"eth": 50, "usb": 100}
-                },  # eth: 29.414     usb: 60.875
-                "basesystem_b": {
-                    "timeout": {"eth": 50, "usb": 100}
-                },  # eth: 29.426     usb: 61.013
-                "app_param": {
-                    "timeout": {"eth": 1000, "usb": 50}
-                },  # eth:       usb: 30.662s
-                "app_param_bak": {
-                    "timeout": {"eth": 1000, "usb": 50}
-                },  # eth:       usb: 30.466s
-                "emmc_boot1": {
-                    "timeout": {"eth": 1000, "usb": 10}
-                },  # eth:       usb: 4.873
-            }
-
-            target_data_jsons = [
-                file
-                for file in os.listdir(self.img_packages)
-                if re.match(f"data.*{host_name}.*json", file)
-            ]
+            # 一次遍历目录获取所有文件大小，避免逐个stat
+            with os.scandir(self.img_packages) as entries:
+                sizes = {entry.name: entry.stat().st_size for entry in entries if entry.is_file()}
+
+            # 一次遍历同时筛选出目标data json和lts data json
+            host_re = re.compile(rf"data.*{re.escape(host_name)}.*json")
+            lts_re = re.compile(rf"data.*{re.escape(host_name)}_[Vv]\d.\d.*json")
+            target_data_jsons, lts_data_jsons = [], []
+            for file in sizes:
+                if host_re.match(file):
+                    target_data_jsons.append(file)
+                    if lts_re.match(file):
+                        lts_data_jsons.append(file)
             if not len(target_data_jsons):
                 self.logger.error(
                     f"no data json in {self.img_packages} for {host_name}"
@@ -437,13 +412,6 @@ class Fastboot:
 
             data_json = None
 
-            lts_data_jsons = [
-                data_json
-                for data_json in target_data_jsons
-                if re.match(
-                    f"data.*{host_name}_[Vv]{{1}}[0-9]{{1}}.[0-9]{{1}}.*json", data_json
-                )
-            ]
             if not len(lts_data_jsons):
                 self.logger.info(
                     f"no lts data json in {self.img_packages} for {host_name}, using default {target_data_jsons[0]}"
@@ -452,80 +420,85 @@ class Fastboot:
             else:
                 data_json = sorted(
                     lts_data_jsons,
-                    key=lambda x: tuple(
-                        map(float, re.search(r"_V(\d+)\.(\d+)", x).groups())
-                    ),
+                    key=lambda x: tuple(map(int, _LTS_VERSION_RE.search(x).groups())),
                 )[-1]
 
             self.logger.info(f"using data file {data_json} for upgrading {host_name}")
 
-            data_dict: dict = json.loads(
-                open(f"{self.img_packages}/{data_json}", "rb").read().decode("utf-8")
-            )
+            # data_dict会被修改，不走_load_json缓存
+            with open(f"{self.img_packages}/{data_json}", "rb") as f:
+                data_dict: dict = json.load(f)
             self.logger.info(f"{data_json} version: {data_dict['version']}")
             data_dict["images"] = {
                 f"gpt_main_{host_name}_emmc.img": {
                     "name": f"gpt_main_{host_name}_emmc.img",
-                    "size": os.path.getsize(
-                        f"{self.img_packages}/gpt_main_{host_name}_emmc.img"
-                    ),
+                    "size": sizes[f"gpt_main_{host_name}_emmc.img"],
                     "storages": {"emmc": {"sync": None, "part_info": ["gpt"]}},
                 },
                 f"gpt_main_{host_name}_emmc_boot0.img": {
                     "name": f"gpt_main_{host_name}_emmc_boot0.img",
-                    "size": os.path.getsize(
-                        f"{self.img_packages}/gpt_main_{host_name}_emmc_boot0.img"
-                    ),
+                    "size": sizes[f"gpt_main_{host_name}_emmc_boot0.img"],
                     "storages": {"emmc_boot0": {"sync": None, "part_info": ["gpt"]}},
                 },
                 **data_dict["images"],
             }
 
             flash_commands = []
+            flash_batch = []  # ((flash参数, 是否需要sparse), 单条烧写命令)
+
+            def __flush_flash_batch():
+                # oem命令会吞掉其后所有参数，只能单独执行；
+                # 连续的flash命令合并为一次fastboot调用，复用同一次连接
+                if len(flash_batch) == 1:
+                    flash_commands.append(flash_batch[0][1])
+                elif flash_batch:
+                    flash_commands.append(
+                        {
+                            "content": _flash_command(fastboot_prefix, [args for args, _ in flash_batch]),
+                            "timeout": sum(command["timeout"] for _, command in flash_batch),
+                            "commands": [command for _, command in flash_batch],
+                        }
+                    )
+                flash_batch.clear()
+
+            last_pre_command = None
             for image_info in data_dict["images"].keys():
-                image_flash_command = []
                 has_gpt = None
+                image_name = data_dict["images"][image_info]["name"]
                 for medium in data_dict["images"][image_info]["storages"].keys():
-                    if medium == "emmc":
-                        flash_pre_command, has_gpt = (
-                            __host_run_fastboot_format_init_command("soc", part="uda")
-                        )
-                    elif medium == "emmc_boot0":
-                        flash_pre_command, has_gpt = (
-                            __host_run_fastboot_format_init_command("soc", part="boot0")
-                        )
-                    elif medium == "emmc_boot1":
-                        flash_pre_command, has_gpt = (
-                            __host_run_fastboot_format_init_command("soc", part="boot1")
-                        )
-                    elif medium == "nor":
-                        flash_pre_command, has_gpt = (
-                            __host_run_fastboot_format_init_command("mcu")
-                        )
-                    else:
+                    if medium not in medium_init_commands:
                         self.logger.info(f"unknown medium {medium}")
                         continue
+                    flash_pre_command, has_gpt = medium_init_commands[medium]
 
-                    image_flash_command.extend(flash_pre_command)
+                    # 与上一个镜像处于同一介质时，设备端状态不变，无需重复下发oem命令
+                    if flash_pre_command is not last_pre_command:
+                        __flush_flash_batch()
+                        flash_commands.extend(flash_pre_command)
+                        last_pre_command = flash_pre_command
 
                     for part in data_dict["images"][image_info]["storages"][medium][
                         "part_info"
                     ]:
-                        image_flash_part_command = {}
-                        image_flash_part_command["timeout"] = (
-                            partition_flash_attribute.get(part)["timeout"][
-                                fastboot_type
-                            ]
-                        )
-
-                        image_flash_part_command["content"] = (
-                            f"sudo fastboot {self.fastboot_options[fastboot_type]}flash {part if has_gpt else '0'} "
-                            f'{"-S 32M " if os.path.getsize(self.img_packages + "/" + data_dict["images"][image_info]["name"]) / (1024 * 1024) > 32 else ""}'
-                            f'{self.img_packages}/{data_dict["images"][image_info]["name"]}'
+                        # 只在确实要烧写时才取镜像大小；不在img_packages顶层的镜像单独stat
+                        image_size = sizes.get(image_name)
+                        if image_size is None:
+                            try:
+                                image_size = os.path.getsize(f"{self.img_packages}/{image_name}")
+                            except OSError:
+                                # 与逐个stat时一致，缺少镜像时中止烧写
+                                self.logger.error(f"missing image {image_name} in {self.img_packages}")
+                                raise
+                        flash_args = (
+                            f"flash {part if has_gpt else '0'} {self.img_packages}/{image_name}",
+                            image_size > _SPARSE_LIMIT,
                         )
-
-                        image_flash_command.append(image_flash_part_command)
-                flash_commands.extend(image_flash_command)
+                        image_flash_part_command = {
+                            "content": _flash_command(fastboot_prefix, [flash_args]),
+                            "timeout": _PART_FLASH_TIMEOUT[part][fastboot_type],
+                        }
+                        flash_batch.append((flash_args, image_flash_part_command))
+            __flush_flash_batch()
 
             self.logger.debug(json.dumps(flash_commands, indent=4, ensure_ascii=False))
             return flash_commands
@@ -533,7 +506,7 @@ class Fastboot:
         def __host_run_fastboot_format_deinit_command() -> list:
             return [
                 {
-                    "content": f"sudo fastboot {self.fastboot_options[fastboot_type]} reboot",
+                    "content": f"{fastboot_prefix} reboot",
                     "timeout": 1,
                 },  # eth: 0.000      usb: 0.352
             ]
@@ -543,37 +516,66 @@ class Fastboot:
             "deinit": __host_run_fastboot_format_deinit_command,
         }
 
+        def __host_run_fastboot_command(command, command_retry_times) -> bool:
+            if not retry(
+                self.logger,
+                command_retry_times,
+                lambda: session.run_cmd(
+                    f"local",
+                    f'{command["content"]}',
+                    [],
+                    ["Finished."],
+                    True,
+                    command["timeout"],
+                    self.logger,
+                ) == 0,
+                f'run fastboot command: {command["content"]}',
+            ):
+                return False
+            self.logger.debug(
+                f'succeed to run fastboot command: {command["content"]}'
+            )
+            return True
+
         for step in host_run_fastboot_step.keys():
             command_retry_times = 3
             for command in host_run_fastboot_step[step]():
-                for retry_times in range(command_retry_times):
-                    if (
-                        session.run_cmd(
-                            f"local",
-                            f'{command["content"]}',
-                            [],
-                            ["Finished."],
-                            True,
-                            command["timeout"],
-                            self.logger,
-                        )
-                        == 0
-                    ):
-                        self.logger.debug(
-                            f'succeed to run fastboot command: {command["content"]}'
-                        )
-                        break
-                    self.logger.warning(
-                        f'failed to run fastboot command: {command["content"]} {retry_times + 1} times'
-                    )
+                if "commands" in command:
+                    # 合并后的命令只尝试一次，失败后逐条烧写以保留单分区重试粒度
+                    if __host_run_fastboot_command(command, 1):
+                        continue
+                    sub_commands = command["commands"]
                 else:
-                    self.logger.error(
-                        f"failed to run fastboot command, retry times exceed max times ({command_retry_times} times)"
-                    )
-                    return False
+                    sub_commands = [command]
+
+                for sub_command in sub_commands:
+                    if not __host_run_fastboot_command(sub_command, command_retry_times):
+                        return False
         self.logger.debug(f"succeed to run all fastboot command")
         return True
 
+    def __is_extracted(self, manifest, source):
+        """清单与当前升级包一致，且包内每个文件(mcu模块还包括复制出的IMG文件)都已按原大小解压时返回True"""
+        try:
+            if json.loads(Path(manifest).read_text()) != source:
+                return False
+            with zipfile.ZipFile(source['package'], 'r') as zip_ref:
+                members = [member for member in zip_ref.infolist() if not member.is_dir()]
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return False
+
+        expected = {os.path.join(self.img_packages, member.filename): member.file_size for member in members}
+        if source['module'] == 'mcu':
+            expected.update({
+                os.path.join(self.img_packages, os.path.basename(member.filename)): member.file_size
+                for member in members
+                if os.path.dirname(member.filename) == 'IMG'
+            })
+        try:
+            return all(os.path.getsize(path) == size for path, size in expected.items())
+        except OSError:
+            return False
+
     def upgrade(
         self,
         fastboot_type: str = "usb",
@@ -597,30 +599,49 @@ class Fastboot:
                 os.makedirs(self.img_packages)
 
             if os.path.isfile(link):
+                # 本地包不做整包摘要，由下方清单中的路径/大小/修改时间判断是否为同一个包
                 ota_package = os.path.abspath(link)
+                package_digest = None
             else:
-                result, ota_package = self.__download_package(module, link, host_name)
+                result, ota_package, package_digest = self.__download_package(module, link, host_name)
                 if not result:
                     self.logger.error(f'link is neither a ota update file nor a valid ota zip url for download: {link}')
                     return False
 
             self.logger.debug(f'using ota package: {ota_package}')
 
-            try:
-                with zipfile.ZipFile(ota_package, 'r') as zip_ref:
-                    zip_ref.extractall(self.img_packages)
-            except zipfile.BadZipFile as e:
-                self.logger.error(f'{e}')
-                return False
-
-            if module == 'mcu':
-                if not os.path.exists(f'{self.img_packages}/IMG/'):
-                    self.logger.error(f'no IMG directory at {self.img_packages}')
+            # 记录已解压升级包的来源及模块，同一个包再次升级且解压结果完整时跳过解压
+            package_stat = os.stat(ota_package)
+            source = {
+                'package': ota_package,
+                'size': package_stat.st_size,
+                'mtime_ns': package_stat.st_mtime_ns,
+                'digest': package_digest,
+                'module': module,
+            }
+            manifest = f'{self.img_packages}/.source.json'
+            if self.__is_extracted(manifest, source):
+                self.logger.info(f'reusing previously extracted package in {self.img_packages}')
+            else:
+                # 先删除清单，解压或复制中途失败时不会被误认为已解压
+                if os.path.exists(manifest):
+                    os.remove(manifest)
+
+                try:
+                    extract_package(ota_package, self.img_packages)
+                except zipfile.BadZipFile as e:
+                    self.logger.error(f'{e}')
                     return False
-                for image in os.listdir(f'{self.img_packages}/IMG/'):
-                    shutil.copy2(os.path.join(f'{self.img_packages}/IMG/', image), os.path.join(self.img_packages, image))
 
-            self.logger.debug(f'succeed unzip {ota_package} to {self.img_packages}')
+                if module == 'mcu':
+                    if not os.path.exists(f'{self.img_packages}/IMG/'):
+                        self.logger.error(f'no IMG directory at {self.img_packages}')
+                        return False
+                    for image in os.listdir(f'{self.img_packages}/IMG/'):
+                        shutil.copy2(os.path.join(f'{self.img_packages}/IMG/', image), os.path.join(self.img_packages, image))
+
+                Path(manifest).write_text(json.dumps(source))
+                self.logger.debug(f'succeed unzip {ota_package} to {self.img_packages}')
 
         else:
             for path in glob.glob(f'./out/release*/target/product/img_packages'):
@@ -652,11 +673,8 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
 
-    board_config = json.loads(open(
-        importlib.util.find_spec('cicd').submodule_search_locations[0] + "/config/device/board.json", 'rb').read().decode('utf-8'))
-    device_config: dict = json.loads(
-        open("/dev/serial/by-name/cicd-vw/device.json", "rb").read().decode("utf-8")
-    )
+    board_config = Fastboot._board_config()
+    device_config = Fastboot._device_config()
     supported_boards = "\n".join(f"\033[32m{key}\033[0m" for key in board_config.keys())
     parser = argparse.ArgumentParser(
         description=f"Fastboot utility, support list:\n{supported_boards}",
@@ -1,19 +1,22 @@
 # -*- coding:utf-8 -*-
 
-import serial
-import time
 import logging
 import sys
 import argparse
 import importlib.util
 import json
 import os
-from ecdsa import SigningKey
-from hashlib import sha256
+import functools
+import re
 
-logging.basicConfig(
-    level=logging.DEBUG,
-)
+# 'Rondom numbers are:'之后的十六进制随机数，可能与标志同行或在下一行，字节间可能有空白
+_RANDOM_RE = re.compile(rb"\A\s*([0-9A-Fa-f]{2}(?:[ \t]*[0-9A-Fa-f]{2})*)[ \t]*\r?\n")
+
+
+@functools.lru_cache(maxsize=None)
+def _load_json(path: str) -> dict:
+    with open(path, "rb") as f:
+        return json.load(f)
 
 
 class UnlockMCU(argparse.Action):
@@ -25,21 +28,18 @@ class UnlockMCU(argparse.Action):
         with open(os.path.join(self.mcu_firmware, "certificate.crt"), "rb") as f:
             certficate = f.read().decode("utf-8").strip()
 
-        chunk_size = 60
-        chunks = [
-            certficate[i : i + chunk_size]
-            for i in range(0, len(certficate), chunk_size)
-        ]
-        for idx, chunk in enumerate(chunks):
-            result = self.__send_command(
-                f"shell_cmd_SentCert {len(certficate)} {idx + 1} {1 if idx == len(chunks) - 1 else 0} {len(chunk)} {chunk}"
-            )
-
-            if "Successfully received data" not in result:
-                self.logger.error(f"Failed to send certificate chunk{idx + 1}")
-                exit(1)
-
-        random_data = result.split("Rondom numbers are:")[-1]
+        commands = self.__format_chunk_commands(
+            b"shell_cmd_SentCert", certficate.encode("ascii"), 60
+        )
+        failed_idx, result = self.__send_chunks(commands, "Rondom numbers are:")
+        if failed_idx is not None:
+            self.logger.error(f"Failed to send certificate chunk{failed_idx + 1}")
+            exit(1)
+
+        random_data = self.__read_random()
+        if random_data is None:
+            self.logger.error("Failed to read random numbers after 'Rondom numbers are:'")
+            exit(1)
         self.logger.info(f"random seed: {random_data}")
 
         signature = self.__gen_signature(random_data).hex()
@@ -47,19 +47,13 @@ class UnlockMCU(argparse.Action):
             f"signature: {signature}",
         )
 
-        chunk_size = 50
-        chunks = [
-            signature[i : i + chunk_size]
-            for i in range(0, len(signature), chunk_size)
-        ]
-        for idx, chunk in enumerate(chunks):
-            result = self.__send_command(
-                f"shell_cmd_SentSignature {len(signature)} {idx + 1} {1 if idx == len(chunks) - 1 else 0} {len(chunk)} {chunk}"
-            )
-
-            if "Successfully received data" not in result:
-                self.logger.error(f"Failed to send signature chunk{idx + 1}")
-                exit(1)
+        commands = self.__format_chunk_commands(
+            b"shell_cmd_SentSignature", signature.encode("ascii"), 50
+        )
+        failed_idx, result = self.__send_chunks(commands, "Debug mode ON!")
+        if failed_idx is not None:
+            self.logger.error(f"Failed to send signature chunk{failed_idx + 1}")
+            exit(1)
 
         verify_result = "Debug mode ON!" in result
 
@@ -77,60 +71,126 @@ class UnlockMCU(argparse.Action):
             config_root_path = "."
 
         self.mcu_firmware = config_root_path + "/config/mcu_firmware"
+        self._signing_key = None
 
-        self.serial_param = json.loads(
-            open(config_root_path + "/config/device/connect_param.json", "rb")
-            .read()
-            .decode("utf-8")
+        self.serial_param = _load_json(
+            config_root_path + "/config/device/connect_param.json"
         )["serial"]
+        # 流水线发送分块(等待第i块应答前先发出第i+1块)需要MCU shell能缓存一整块提前到达的输入，
+        # 由connect_param.json中serial.mcu.pipeline_chunks开启，默认逐块等待应答
+        self.pipeline_chunks = self.serial_param["mcu"].get("pipeline_chunks", False)
 
         self.logger.info(
             f"open mcu serial port: {self.serial_param['mcu']['port']}, baudrate: {self.serial_param['mcu']['baudrate']}"
         )
+        import serial
+
         self.mcu_serial = serial.Serial(
             self.serial_param["mcu"]["port"],
             self.serial_param["mcu"]["baudrate"],
-            timeout=1,
+            timeout=3,
         )
 
-    def __send_command(self, command):
-        for byte in f"{command}\r\n".encode("utf-8"):
-            self.mcu_serial.write([byte])
-            time.sleep(0.01)
+    @staticmethod
+    def __format_chunk_commands(name: bytes, data: bytes, chunk_size: int) -> list:
+        """
+        将数据按chunk_size分块，直接用bytes拼接出每块的完整命令行，
+        格式：<name> <总长度> <块序号> <是否最后一块> <块长度> <块内容>\r\n
+        """
+        view = memoryview(data)
+        offsets = range(0, len(data), chunk_size)
+        commands = []
+        for idx, offset in enumerate(offsets):
+            chunk = view[offset : offset + chunk_size]
+            last = 1 if idx == len(offsets) - 1 else 0
+            commands.append(
+                b"%s %d %d %d %d " % (name, len(data), idx + 1, last, len(chunk))
+                + chunk
+                + b"\r\n"
+            )
+        return commands
+
+    def __send_chunks(self, commands, last_expected):
+        """
+        逐块发送命令并等待应答，某块应答中没有"Successfully received data"时立即停止，不再发送后续分块；
+        pipeline_chunks为True时等待第i块应答前先发出第i+1块，串口发送耗时与MCU处理耗时重叠
+        返回 (失败的块序号，全部成功时为None, 最后读到的应答)
+        """
+        written = 0
+        result = ""
+        for idx in range(len(commands)):
+            send_until = min(len(commands), idx + (2 if self.pipeline_chunks else 1))
+            while written < send_until:
+                self.__write_command(commands[written])
+                written += 1
+
+            result = self.__read_reply(
+                last_expected if idx == len(commands) - 1 else "Successfully received data"
+            )
+            if "Successfully received data" not in result:
+                if written > idx + 1:
+                    self.logger.warning(f"chunk{idx + 2} was already sent ahead of the failed chunk{idx + 1}")
+                return idx, result
+        return None, result
+
+    def __write_command(self, command: bytes):
+        # 整条命令一次写入，由串口驱动按波特率发送，不再逐字节写入并sleep；flush等待发送缓冲区排空
+        self.mcu_serial.write(command)
         self.mcu_serial.flush()
 
-        output = bytes()
-        time_limit = time.time() + 3
-        while time.time() < time_limit:
-            if not self.mcu_serial.in_waiting:
-                if not len(output):
-                    time.sleep(0.01)
-                else:
-                    break
-            else:
-                while self.mcu_serial.in_waiting > 0 and time.time() < time_limit:
-                    output += self.mcu_serial.read(self.mcu_serial.in_waiting)
-                    time.sleep(0.1)
+    def __read_reply(self, expected):
+        # 阻塞读取直到收到期望的应答标志(最长等待串口timeout)，数据到达即返回，不再轮询sleep
+        output = self.mcu_serial.read_until(expected.encode("utf-8"))
+        result = output.decode("utf-8", "ignore")
+        self.logger.debug(result)
+        return result
+
+    def __read_random(self, max_size=1024):
+        """
+        读取'Rondom numbers are:'之后的十六进制随机数，随机数可能与标志同行，也可能在之后的行中；
+        按行累积(最多max_size字节)直到匹配到完整的十六进制内容，超时或超出长度仍未匹配时返回None
+        """
+        output = bytearray()
+        while len(output) < max_size:
+            line = self.mcu_serial.read_until(b"\n", max_size - len(output))
+            if not line:
+                break
+            output += line
+            match = _RANDOM_RE.match(output)
+            if match:
+                self.logger.debug(output.decode("utf-8", "ignore"))
+                return match.group(1).decode("ascii")
 
         self.logger.debug(output.decode("utf-8", "ignore"))
-        return output.decode("utf-8", "ignore")
+        return None
 
     def __gen_signature(self, data: str):
-        with open(os.path.join(self.mcu_firmware, "pkcs8.key"), "rb") as f:
-            private_key = SigningKey.from_pem(f.read(), hashfunc=sha256)
-
-        return private_key.sign(bytes.fromhex(data), hashfunc=sha256)
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        # 私钥只在首次签名时加载解析，之后复用
+        if self._signing_key is None:
+            with open(os.path.join(self.mcu_firmware, self.unlock_key), "rb") as f:
+                self._signing_key = load_pem_private_key(f.read(), password=None)
+
+        # MCU校验的是原始r||s格式签名，需将DER编码转换回定长拼接
+        r, s = decode_dss_signature(
+            self._signing_key.sign(bytes.fromhex(data), ec.ECDSA(hashes.SHA256()))
+        )
+        size = (self._signing_key.curve.key_size + 7) // 8
+        return r.to_bytes(size, "big") + s.to_bytes(size, "big")
 
 
 def main(args=None):
     if args is None:
         args = sys.argv[1:]
 
-    parser = argparse.ArgumentParser(description="Unlock MCU via serial port")
-    parser.add_argument(
-        "-u", type=str, help="unlock mcu", action=UnlockMCU, metavar="", nargs=0
-    )
-    parser.add_argument(
+    # UnlockMCU在add_argument时即打开串口，解锁及exit()在parse_args()内执行，
+    # 需先单独解析-l并配置好日志，再创建完整的parser
+    log_parser = argparse.ArgumentParser(add_help=False)
+    log_parser.add_argument(
         "-l",
         dest="level",
         choices=logging._nameToLevel.keys(),
@@ -138,11 +198,17 @@ def main(args=None):
         type=str,
         help="log level",
     )
-    args = parser.parse_args()
+    log_args, _ = log_parser.parse_known_args(args)
 
     logging.basicConfig(
-        level=logging._nameToLevel[args.level],
+        level=logging._nameToLevel[log_args.level],
         format="%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
         handlers=[logging.StreamHandler(sys.stdout)],
     )
+
+    parser = argparse.ArgumentParser(description="Unlock MCU via serial port", parents=[log_parser])
+    parser.add_argument(
+        "-u", type=str, help="unlock mcu", action=UnlockMCU, metavar="", nargs=0
+    )
+    args = parser.parse_args(args)
@@ -0,0 +1,111 @@
+import os
+import time
+import random
+import shutil
+import zipfile
+import hashlib
+import mmap
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+# fastboot与uartboot共用的升级包下载、重试和解压逻辑，两边只保留这一份实现
+
+
+def hash_file(path: str, new_hash):
+    """计算整个文件的摘要，new_hash为返回新摘要对象的callable(如hashlib.md5)"""
+    # 在C层完成整个文件的读取和摘要计算，没有Python层的分块循环
+    with open(path, 'rb') as file:
+        try:
+            return hashlib.file_digest(file, new_hash)
+        except AttributeError:  # python < 3.11
+            file_hash = new_hash()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                file_hash.update(mm)
+            return file_hash
+
+
+def retry(logger, max_retry_times, operation, description, backoff=False):
+    """
+    重试执行operation，返回首个为真的结果；异常或结果为假时重试，全部失败返回None
+    backoff为True时每次重试前按指数退避(带随机抖动)等待，用于下载等网络操作
+    """
+    for retry_times in range(max_retry_times):
+        try:
+            result = operation()
+            if result:
+                return result
+            logger.warning(f'failed to {description} for {retry_times + 1} times')
+        except Exception as e:
+            logger.warning(f'failed to {description} for {retry_times + 1} times\n{e}')
+        if backoff and retry_times + 1 < max_retry_times:
+            time.sleep(min(60, 2 ** retry_times + random.uniform(0, 1)))
+    logger.error(f'failed to {description}, retry times exceed max times ({max_retry_times} times)')
+    return None
+
+
+def fetch_package(http_get, package_url, package_path, new_hash, download_timeout) -> str:
+    """
+    下载package_url到package_path，返回整个文件的摘要(hex)
+    已下载的部分先计入摘要，剩余部分通过Range续传，边下载边计算摘要；http_get为requests.get或Session.get
+    """
+    offset = os.path.getsize(package_path) if os.path.exists(package_path) else 0
+    package_hash = hash_file(package_path, new_hash) if offset else new_hash()
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    deadline = time.time() + download_timeout
+
+    with http_get(package_url, headers=headers, stream=True, timeout=30) as response:
+        if offset and response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            # 本地文件已下载完整
+            return package_hash.hexdigest()
+        response.raise_for_status()
+        if offset and response.status_code != HTTPStatus.PARTIAL_CONTENT:
+            # 服务器不支持续传，从头下载
+            offset = 0
+            package_hash = new_hash()
+
+        with open(package_path, 'ab' if offset else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                if time.time() > deadline:
+                    raise TimeoutError(f'download not finished in {download_timeout}s')
+                package_hash.update(chunk)
+                file.write(chunk)
+
+    return package_hash.hexdigest()
+
+
+def extract_package(package_path, target_dir, max_workers=4):
+    """多线程解压package_path到target_dir，跳过指向target_dir之外的成员"""
+    with zipfile.ZipFile(package_path, 'r') as zip_ref:
+        members = sorted(zip_ref.infolist(), key=lambda info: info.file_size, reverse=True)
+
+    # 先创建好目录，避免多个线程同时创建同一父目录
+    root = os.path.realpath(target_dir)
+    for member in members:
+        member_dir = os.path.realpath(os.path.join(root, os.path.dirname(member.filename)))
+        if os.path.commonpath([root, member_dir]) == root:
+            os.makedirs(member_dir, exist_ok=True)
+
+    def __extract(chunk):
+        # ZipFile对象非线程安全，每个线程单独打开；zlib解压期间会释放GIL
+        with zipfile.ZipFile(package_path, 'r') as zip_ref:
+            for member in chunk:
+                target = os.path.realpath(os.path.join(root, member.filename))
+                # 跳过指向解压目录之外的成员
+                if os.path.commonpath([root, target]) != root:
+                    continue
+                if member.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                # 使用1MB缓冲区流式解压，减少read/write调用次数
+                with zip_ref.open(member) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, length=1024 * 1024)
+                mtime = time.mktime(member.date_time + (0, 0, -1))
+                os.utime(target, (mtime, mtime))
+
+    # 按文件大小轮流分配，使各线程解压量大致均衡
+    chunks = [members[i::max_workers] for i in range(max_workers)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(__extract, chunk) for chunk in chunks if chunk]:
+            future.result()
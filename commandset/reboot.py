@@ -1,17 +1,27 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import random
+import functools
 import logging
 import sys
 import argparse
 import time
-import requests
-import redis
 import json
 import socket
+import struct
+import threading
 from abc import ABC, abstractmethod
-from pymodbus.client import ModbusTcpClient
+
+
+# 未配置或无法连接 redis 时使用的进程内锁
+_LOCAL_RELAY_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _load_device_config() -> dict:
+    """读取设备配置，进程内只解析一次"""
+    with open("/dev/serial/by-name/cicd-vw/device.json", "rb") as f:
+        return json.load(f)
 
 
 class BaseRelay(ABC):
@@ -23,11 +33,10 @@ class BaseRelay(ABC):
     PORT_ON = 0
     PORT_OFF = 1
     REBOOT_INTERVAL = 0.5
+    ACTIONS = ("on", "off", "reboot")
 
     def __init__(self, logger=logging.getLogger()):
-        device_config: dict = json.loads(
-            open("/dev/serial/by-name/cicd-vw/device.json", "rb").read().decode("utf-8")
-        )
+        device_config: dict = _load_device_config()
         relay_config: dict = device_config["relay_intf"]
         self.relay_ip = relay_config["server_addr"]
         # self.relay_lock = redis.Redis(host=relay_config["client_addr"]).lock(...)  # 移除
@@ -63,12 +72,17 @@ class BaseRelay(ABC):
 
         self.logger.debug(f"it's going to run power {action}, port: {port}")
 
-        if not hasattr(self, f"_port_{action}"):
+        if action not in self.ACTIONS:
             self.logger.error(f"invalid action: {action}")
             return False
 
-        method = getattr(self, f"_port_{action}")
-        return method(port)
+        return self._execute(action, port)
+
+    def _execute(self, action, port):
+        """
+        执行已校验过的动作，子类可重写以加入确认、加锁等逻辑
+        """
+        return getattr(self, f"_port_{action}")(port)
 
 
 class Relay_default(BaseRelay):
@@ -78,11 +92,34 @@ class Relay_default(BaseRelay):
 
     def __init__(self, logger=logging.getLogger()):
         super().__init__(logger)
-        device_config: dict = json.loads(
-            open("/dev/serial/by-name/cicd-vw/device.json", "rb").read().decode("utf-8")
-        )
+        device_config: dict = _load_device_config()
         relay_config: dict = device_config["relay_intf"]
-        self.relay_lock = redis.Redis(host=relay_config["client_addr"]).lock(
+        self.relay_lock = self.__create_lock(relay_config.get("client_addr"))
+        # 复用同一个HTTP连接(keep-alive)，避免每次请求都重新建立TCP连接
+        import requests
+
+        self._http = requests.Session()
+        self._http.mount(
+            "http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        )
+
+    def __create_lock(self, client_addr):
+        """
+        多个容器共用继电器时通过 redis 分布式锁互斥；redis 在首次 acquire 时才建立连接，
+        连接失败时在 __acquire_lock 中退化为进程内锁
+        """
+        if not client_addr:
+            return _LOCAL_RELAY_LOCK
+
+        try:
+            import redis
+        except ImportError as e:
+            self.logger.warning(f"redis is unavailable, using process local relay lock\n{e}")
+            return _LOCAL_RELAY_LOCK
+
+        self._redis_errors = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+        client = redis.Redis(host=client_addr, socket_connect_timeout=1)
+        return client.lock(
             "carizon_relay",
             timeout=self.REBOOT_INTERVAL + 3.5,
             sleep=0.1,
@@ -90,28 +127,40 @@ class Relay_default(BaseRelay):
             blocking_timeout=self.REBOOT_INTERVAL + 3.5,
         )
 
+    def __acquire_lock(self):
+        # 进程内锁与 redis 锁一样限时等待，超时后按"someone else may using"失败处理
+        if self.relay_lock is not _LOCAL_RELAY_LOCK:
+            try:
+                return self.relay_lock.acquire()
+            except self._redis_errors as e:
+                self.logger.warning(f"redis is unavailable, using process local relay lock\n{e}")
+                self.relay_lock = _LOCAL_RELAY_LOCK
+        return self.relay_lock.acquire(timeout=self.REBOOT_INTERVAL + 3.5)
+
     def __port_ctrl(self, port):
         try:
-            req = requests.get(
-                f"http://{self.relay_ip}/CN/httpapi.json?sndtime={str(random.random())}&CMD=UART_WRITE&UWHEXVAL={str(port)}"
+            req = self._http.get(
+                f"http://{self.relay_ip}/CN/httpapi.json?sndtime={time.time_ns()}&CMD=UART_WRITE&UWHEXVAL={str(port)}",
+                timeout=3,
             )
         except BaseException as e:
             self.logger.error(f"{type(e).__name__}, {e}")
             return None
 
-        ports_status = int(req.text.split(",")[0])
-        return [ports_status >> port_num & 1 for port_num in range(self.MAX_PORT_NUM)]
+        # 返回所有端口状态的位图，第 n 路对应第 n-1 位
+        return int(req.text.split(",")[0])
 
     def __get_port_status(self, port):
-        return self.__port_ctrl(0)[port - 1]
+        return self.__port_ctrl(0) >> (port - 1) & 1
 
+    # 写端口的应答中已包含所有端口状态，直接使用，无需再次请求查询
     def _port_on(self, port):
-        self.__port_ctrl(port)
-        return self.__get_port_status(port) == self.PORT_ON
+        status = self.__port_ctrl(port)
+        return status is not None and (status >> (port - 1) & 1) == self.PORT_ON
 
     def _port_off(self, port):
-        self.__port_ctrl(port)
-        return self.__get_port_status(port) == self.PORT_OFF
+        status = self.__port_ctrl(port)
+        return status is not None and (status >> (port - 1) & 1) == self.PORT_OFF
 
     def _port_reboot(self, port):
         return (
@@ -120,20 +169,7 @@ class Relay_default(BaseRelay):
             and self._port_on(port)
         )
 
-    def execute(self, action, port: int = None):
-        port = port or self.relay_port
-        if port > self.MAX_PORT_NUM:
-            self.logger.error(
-                f"dest port {port} is over than max port num {self.MAX_PORT_NUM}"
-            )
-            return False
-
-        self.logger.debug(f"it's going to run power {action}, port: {port}")
-
-        if not hasattr(self, f"_port_{action}"):
-            self.logger.error(f"invalid action: {action}")
-            return False
-
+    def _execute(self, action, port):
         if port != self.relay_port:
             try:
                 force = (
@@ -155,13 +191,16 @@ class Relay_default(BaseRelay):
                 self.logger.info(f"user canceled dangerous action")
                 return False
 
-        if self.relay_lock.acquire():
+        if self.__acquire_lock():
             try:
-                status = self.__get_port_status(port)
-                if status == self.PORT_ON and action == "on":
-                    return True
-                elif status == self.PORT_OFF and action == "off":
-                    return True
+                # UART_WRITE 为翻转端口，on/off 需先查询状态避免翻转到相反状态；
+                # reboot 不依赖当前状态，省去这次查询请求
+                if action != "reboot":
+                    status = self.__get_port_status(port)
+                    if status == self.PORT_ON and action == "on":
+                        return True
+                    elif status == self.PORT_OFF and action == "off":
+                        return True
 
                 ret = getattr(self, f"_port_{action}")(port)
                 self.logger.info(
@@ -181,21 +220,45 @@ class Relay_zqwl(BaseRelay):
     """
 
     SERVER_PORT = 1030  # 默认 MODBUS TCP 端口号
+    STATE_TTL = 2  # 线圈状态快照有效期(s)，避免其他进程修改后仍使用旧状态
 
     def __init__(self, logger=logging.getLogger()):
         super().__init__(logger)
+        self._state = {}  # 已知的线圈状态，寄存器地址 -> 值
+        self._state_time = 0
+        from pymodbus.client import ModbusTcpClient
+
         try:
-            # 连接控制板
+            # 连接控制板，整个实例复用同一个连接
             self.client = ModbusTcpClient(
                 self.relay_ip, port=Relay_zqwl.SERVER_PORT, timeout=5
             )
             if self.client.connect():
                 self.logger.debug("Connected to the controller.")
+                sock = getattr(self.client, "socket", None)
+                if sock is not None:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         except Exception as e:
             self.logger.error(f"Failed to connect to the controller.\n{e}")
 
+    def __snapshot(self):
+        # 一次读取所有线圈状态，多个端口共用同一次请求
+        bits = self.client.read_coils(address=0, count=self.MAX_PORT_NUM).bits
+        self._state = dict(enumerate(bits[: self.MAX_PORT_NUM]))
+        self._state_time = time.monotonic()
+
     def __get_port_status(self, port):
-        return self.client.read_coils(address=port, count=1).bits[0]
+        if port not in self._state or time.monotonic() - self._state_time > self.STATE_TTL:
+            self.__snapshot()
+        return self._state[port]
+
+    def __write_port(self, port, value):
+        ok = self.client.write_coil(address=port, value=value).isError() == False
+        if ok:
+            self._state[port] = value
+        else:
+            self._state.pop(port, None)
+        return ok
 
     def _port_on(self, port):
         port = port - 1  # MODBUS 寄存器地址从 0 开始
@@ -204,7 +267,7 @@ class Relay_zqwl(BaseRelay):
             return True
 
         self.logger.debug(f"Turning on port {port}")
-        return self.client.write_coil(address=port, value=False).isError() == False
+        return self.__write_port(port, False)
 
     def _port_off(self, port):
         port = port - 1  # MODBUS 寄存器地址从 0 开始
@@ -213,13 +276,16 @@ class Relay_zqwl(BaseRelay):
             return True
 
         self.logger.debug(f"Turning off port {port}")
-        return self.client.write_coil(address=port, value=True).isError() == False
+        return self.__write_port(port, True)
 
     def _port_reboot(self, port):
+        # 重启时直接写线圈，不再先读状态
+        port = port - 1  # MODBUS 寄存器地址从 0 开始
+        self.logger.debug(f"Rebooting port {port}")
         return (
-            self._port_off(port)
+            self.__write_port(port, True)
             and not time.sleep(self.REBOOT_INTERVAL)
-            and self._port_on(port)
+            and self.__write_port(port, False)
         )
 
 
@@ -229,6 +295,42 @@ class Relay_corx(BaseRelay):
     """
 
     SERVER_PORT = 502  # 默认 MODBUS TCP 端口号
+    RESPONSE_SIZE = 12  # 写单个线圈的响应固定为 12 字节
+    # MBAP 头(事务号 0, 协议号 0, 长度 6, 单元号 1) + 功能码 05(写单个线圈) + 线圈地址 + 值
+    PACKET_FORMAT = struct.Struct(">HHHBBHH")
+    MBAP_HEADER = struct.Struct(">HHHB")  # 事务号, 协议号, 后续长度(含单元号), 单元号
+    COIL_VALUES = {"on": 0xFF00, "off": 0x0000}
+    SOCKET_TIMEOUT = 3  # 连接及读取应答超时(s)，短读时循环接收不会无限阻塞
+
+    def __init__(self, logger=logging.getLogger()):
+        super().__init__(logger)
+        self._sock = None
+
+    def _ensure_socket(self):
+        """
+        复用已建立的 TCP 连接，未连接时才重新连接
+        """
+        if self._sock is None:
+            self._sock = socket.create_connection(
+                (self.relay_ip, self.SERVER_PORT), timeout=self.SOCKET_TIMEOUT
+            )
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.logger.debug(
+                f"已连接到 MODBUS TCP 服务器 {self.relay_ip}:{self.SERVER_PORT}"
+            )
+        return self._sock
+
+    def _recv_exact(self, size):
+        """
+        recv 可能只返回部分数据，循环接收直到读满 size 字节
+        """
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("连接已被服务器关闭")
+            data += chunk
+        return bytes(data)
 
     def _send_modbus_command(self, port, action):
         """
@@ -236,43 +338,42 @@ class Relay_corx(BaseRelay):
         :param port: 选择第几路（十进制输入，如 19 表示第 19 路）
         :param action: 动作，支持 'on', 'off'
         """
-        # 固定的 MODBUS TCP 数据包头部
-        header = "0000000000060105"
-
-        # 计算寄存器地址（16 进制表示的端口号）
-        port_hex = f"{port - 1:04X}"  # 减 1 是因为寄存器地址从 0 开始
-
-        # 根据 action 决定最后 4 位的内容
-        if action == "on":
-            action_hex = "FF00"
-        elif action == "off":
-            action_hex = "0000"
-        else:
+        if action not in self.COIL_VALUES:
             raise ValueError("动作参数仅支持 'on' 或 'off'")
 
-        # 拼接完整的 MODBUS TCP 数据包
-        modbus_tcp_packet = bytes.fromhex(header + port_hex + action_hex)
+        # 打包完整的 MODBUS TCP 数据包，减 1 是因为寄存器地址从 0 开始
+        modbus_tcp_packet = self.PACKET_FORMAT.pack(
+            0, 0, 6, 1, 5, port - 1, self.COIL_VALUES[action]
+        )
 
         try:
-            # 创建 TCP socket
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                # 连接到服务器
-                client_socket.connect((self.relay_ip, self.SERVER_PORT))
-                self.logger.debug(
-                    f"已连接到 MODBUS TCP 服务器 {self.relay_ip}:{self.SERVER_PORT}"
-                )
+            client_socket = self._ensure_socket()
 
-                # 发送数据包
-                client_socket.sendall(modbus_tcp_packet)
+            # 发送数据包
+            client_socket.sendall(modbus_tcp_packet)
+            if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(f"发送数据包: {modbus_tcp_packet.hex()}")
 
-                # 接收服务器的响应
-                response = client_socket.recv(1024)  # 接收最多 1024 字节
+            # 按 MBAP 头中的长度接收完整应答(异常应答短于 12 字节)，不把残留数据留给下一条命令
+            header = self._recv_exact(self.MBAP_HEADER.size)
+            length = self.MBAP_HEADER.unpack(header)[2]
+            if length < 2:
+                raise ValueError(f"无效的 MBAP 长度: {length}")
+            response = header + self._recv_exact(length - 1)
+            if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(f"接收到响应: {response.hex()}")
-                return True
+
+            # 写单个线圈的正常应答回显请求的功能码和线圈地址
+            if len(response) != self.RESPONSE_SIZE or response[7:10] != modbus_tcp_packet[7:10]:
+                raise ValueError(f"应答与请求不匹配: {response.hex()}")
+            return True
 
         except Exception as e:
             self.logger.error(f"发送 MODBUS TCP 命令时发生错误: {e}")
+            # 关闭异常的连接，下次发送时重新连接
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
             return False
 
     def _port_on(self, port):
@@ -314,9 +415,7 @@ class Relay:
 
     def __init__(self, logger=logging.getLogger()):
         # 加载设备配置
-        device_config: dict = json.loads(
-            open("/dev/serial/by-name/cicd-vw/device.json", "rb").read().decode("utf-8")
-        )
+        device_config: dict = _load_device_config()
         relay_config: dict = device_config["relay_intf"]
 
         # 从配置文件中获取继电器类型和 IP
@@ -341,9 +440,7 @@ def main(args=None):
         args = sys.argv[1:]
 
     # 加载设备配置
-    device_config: dict = json.loads(
-        open("/dev/serial/by-name/cicd-vw/device.json", "rb").read().decode("utf-8")
-    )
+    device_config: dict = _load_device_config()
     relay_config: dict = device_config["relay_intf"]
 
     parser = argparse.ArgumentParser(description="Reboot control")
@@ -4,11 +4,15 @@ import json
 import importlib.util
 import argparse
 import logging
+import io
 import re
+import select
+import selectors
 import shutil
 import zipfile
 import glob
 import requests
+import requests.adapters
 import hashlib
 import subprocess
 import time
@@ -16,11 +20,53 @@ import serial
 import serial.tools.list_ports
 from xmodem import XMODEM
 from http import HTTPStatus
-from functools import partial
+from functools import partial, lru_cache
 from rich.progress import Progress, TextColumn, BarColumn, TimeElapsedColumn, TimeRemainingColumn
+from cicd.commandset.package_util import retry, fetch_package, extract_package
+
+
+@lru_cache(maxsize=1)
+def _config_root() -> str:
+    # cicd包所在目录只查找一次，未安装时使用当前目录
+    try:
+        return importlib.util.find_spec("cicd").submodule_search_locations[0]
+    except Exception:
+        return "."
+
+
+def _load_json(path: str) -> dict:
+    # 以规范化后的路径作为缓存key，同一文件只解析一次
+    return _load_json_cached(os.path.normpath(path))
+
+
+@lru_cache(maxsize=None)
+def _load_json_cached(path: str) -> dict:
+    with open(path, "rb") as f:
+        return json.load(f)
+
+
+_DEVICE_INDEX_RE = re.compile(r"(\d+)$")
+# 直接在串口原始字节上匹配，IP后需跟空白字符，避免匹配到尚未接收完整的IP
+_FASTBOOT_IP_RE = re.compile(rb"Listening for fastboot command on (\d+\.\d+\.\d+\.\d+)\s")
+_FASTBOOT_IP_MAX_LEN = len(b"Listening for fastboot command on 255.255.255.255\n")
+
+
+def _device_sort_key(device: str):
+    match = _DEVICE_INDEX_RE.search(device)
+    if match is None:
+        return device, -1
+    return device[:match.start()], int(match.group(1))
 
 
 class Uartboot:
+    # XMODEM接收端就绪标志及MCU shell提示符，直接在串口原始字节上匹配
+    _CCC_PAT = b"CCC"
+    _SHELL_PROMPTS = (b'horizon:/', b'#', b'$', b'root@')
+    # SecureDebug提示及应答(输入0，不加回车)
+    _SECURE_DEBUG_ANSWERS = {b"Please enter 1 or 0": b"0"}
+    # XMODEM传输期间串口的读超时(s)，getc在此粒度上检查自身的截止时间
+    _XMODEM_READ_TIMEOUT = 1
+
     download_timeout = 600
     packet_size = dict(
         xmodem=128,
@@ -31,49 +77,47 @@ class Uartboot:
         self.logger = logger
         self.img_packages = os.path.abspath(f"/tmp/img_packages")
 
-        try:
-            config_root_path = importlib.util.find_spec(
-                "cicd"
-            ).submodule_search_locations[0]
-        except Exception:
-            config_root_path = "."
-        self.boot_config = json.loads(
-            open(config_root_path + "/config/device/uart_boot.json", "rb")
-            .read()
-            .decode("utf-8")
-        )
-        self.serial_param = json.loads(
-            open(config_root_path + "/config/device/connect_param.json", "rb")
-            .read()
-            .decode("utf-8")
-        )["serial"]
-        self.board_config = json.loads(
-            open(config_root_path + "/config/device/board.json", "rb")
-            .read()
-            .decode("utf-8")
-        )
-        self.state_config = json.loads(
-            open(config_root_path + "/config/device/state.json", "rb")
-            .read()
-            .decode("utf-8")
-        )
+        config_root_path = _config_root()
+        self.boot_config = _load_json(config_root_path + "/config/device/uart_boot.json")
+        self.serial_param = _load_json(config_root_path + "/config/device/connect_param.json")["serial"]
+        self.board_config = _load_json(config_root_path + "/config/device/board.json")
+        # board.json中各板卡bsp包路径的最后一级目录即sdk版本，只构建一次板卡到sdk版本的映射
+        self.device_to_sdk_map = {
+            device: package_path.rstrip('/').rsplit('/', 1)[-1]
+            for device, package_path in self.board_config.items()
+        }
+        self.state_config = _load_json(config_root_path + "/config/device/state.json")
+        # uboot提示符合并为一个正则只编译一次；提示符长度用于确定增量查找时与上次数据的重叠长度
+        uboot_prompts = self.state_config["prompts"]["uboot"]
+        self._uboot_prompt_re = re.compile("|".join(f"(?:{prompt})" for prompt in uboot_prompts), re.IGNORECASE)
+        self._uboot_prompt_len = max(len(prompt) for prompt in uboot_prompts)
 
+        # 波特率及硬件流控(rtscts)均取自connect_param.json，提高波特率(如3000000)时建议同时开启rtscts防止溢出
         serial_timeout = 30
         try:
             soc_serial = serial.Serial(
                 self.serial_param["soc"]["port"],
                 self.serial_param["soc"]["baudrate"],
                 timeout=serial_timeout,
+                write_timeout=None,
+                inter_byte_timeout=None,
+                rtscts=self.serial_param["soc"].get("rtscts", False),
             )
             mcu_serial = serial.Serial(
                 self.serial_param["mcu"]["port"],
                 self.serial_param["mcu"]["baudrate"],
                 timeout=serial_timeout,
+                write_timeout=None,
+                inter_byte_timeout=None,
+                rtscts=self.serial_param["mcu"].get("rtscts", False),
             )
             hsm_serial = serial.Serial(
                 self.serial_param["hsm"]["port"],
                 self.serial_param["hsm"]["baudrate"],
                 timeout=serial_timeout,
+                write_timeout=None,
+                inter_byte_timeout=None,
+                rtscts=self.serial_param["hsm"].get("rtscts", False),
             )
         except serial.serialutil.SerialException:
             serial_devices = serial.tools.list_ports.comports()
@@ -85,18 +129,53 @@ class Uartboot:
                     f"扫描到的串口设备数量异常, 期望4个, 实际{len(serial_devices)}个"
                 )
 
-            serial_devices.sort(key=lambda x: int(x.device[3:]))
+            # 按设备名(前缀, 末尾编号)排序，兼容COM3、/dev/ttyUSB10、/dev/ttyACM0等命名
+            serial_devices.sort(key=lambda x: _device_sort_key(x.device))
+
+            def __pick_device(port, index):
+                # connect_param.json中配置了serial_number时按USB序列号匹配，否则按排序后的位置
+                serial_number = self.serial_param[port].get("serial_number")
+                for device in serial_devices:
+                    if serial_number and device.serial_number == serial_number:
+                        return device.device
+                return serial_devices[index].device
+
             hsm_serial = serial.Serial(
-                serial_devices[1].device, 921600, timeout=serial_timeout
+                __pick_device("hsm", 1),
+                self.serial_param["hsm"].get("baudrate", 921600),
+                timeout=serial_timeout,
+                write_timeout=None,
+                inter_byte_timeout=None,
+                rtscts=self.serial_param["hsm"].get("rtscts", False),
             )
             soc_serial = serial.Serial(
-                serial_devices[2].device, 921600, timeout=serial_timeout
+                __pick_device("soc", 2),
+                self.serial_param["soc"].get("baudrate", 921600),
+                timeout=serial_timeout,
+                write_timeout=None,
+                inter_byte_timeout=None,
+                rtscts=self.serial_param["soc"].get("rtscts", False),
             )
             mcu_serial = serial.Serial(
-                serial_devices[3].device, 921600, timeout=serial_timeout
+                __pick_device("mcu", 3),
+                self.serial_param["mcu"].get("baudrate", 921600),
+                timeout=serial_timeout,
+                write_timeout=None,
+                inter_byte_timeout=None,
+                rtscts=self.serial_param["mcu"].get("rtscts", False),
             )
 
         self.serial_ports = {"soc": soc_serial, "mcu": mcu_serial, "hsm": hsm_serial}
+        for serial_port in self.serial_ports.values():
+            self.__set_low_latency(serial_port)
+
+        # 复用同一个HTTPS连接(keep-alive)，多次jfrog请求只做一次TLS握手
+        # adapter不做重试，连接失败及5xx只由外层retry按指数退避重试，避免两层重试叠加(下载可从断点续传)
+        self._http = requests.Session()
+        self._http.mount(
+            "https://",
+            requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0),
+        )
         self.xmodem_mode = 'xmodem1k'
         self.xmodem = {
             "soc": XMODEM(
@@ -116,10 +195,89 @@ class Uartboot:
             ),
         }
 
+    def __set_low_latency(self, serial_port):
+        """
+        打开串口低延迟模式(ASYNC_LOW_LATENCY)，并将FTDI的latency_timer由默认16ms调为1ms，
+        降低XMODEM ACK等小包的往返延迟；不支持或无权限时保持默认设置
+        """
+        try:
+            serial_port.set_low_latency_mode(True)
+        except (AttributeError, NotImplementedError, ValueError, OSError) as e:
+            self.logger.debug(f'failed to enable low latency mode on {serial_port.port}: {e}')
+
+        device_name = os.path.basename(os.path.realpath(serial_port.port))
+        latency_timer = f'/sys/bus/usb-serial/devices/{device_name}/latency_timer'
+        if not os.path.exists(latency_timer):
+            return
+        try:
+            with open(latency_timer, 'w') as f:
+                f.write('1')
+        except OSError as e:
+            self.logger.debug(f'failed to set {latency_timer}: {e}')
+
+    def __wait_for_ccc(self, port, deadline, poke=False, stop_patterns=(), answers=None):
+        """
+        阻塞等待串口出现'CCC'(XMODEM接收端就绪)，数据到达即整块读出并查找，不再sleep轮询
+        poke: 线路空闲时发送回车催促对端
+        stop_patterns: 出现其中任一内容时提前返回失败(如shell提示符)
+        answers: {提示: 应答}，出现提示时延迟2秒后自动应答
+        返回 (是否收到'CCC', 串口输出)
+        """
+        serial_port = self.serial_ports[port]
+        output = bytearray()
+        scanned = 0
+
+        # 只在新读到的数据(及与上次数据衔接处)中查找，跨两次读取的内容也能匹配，且不会重复匹配
+        def __found(pattern):
+            return output.find(pattern, max(0, scanned - len(pattern) + 1)) != -1
+
+        while time.time() < deadline:
+            if poke and not serial_port.in_waiting:
+                serial_port.write(b"\n")
+            # poke时分段等待，以便线路空闲时周期性发送回车；通过select等待而不修改串口超时(每次修改都会重新配置串口)
+            remaining = max(0, deadline - time.time())
+            # 一次读出已到达的全部数据，read_until内部为逐字节读取
+            output += self.__read_available(port, min(remaining, 0.2) if poke else remaining)
+            if __found(self._CCC_PAT):
+                return True, bytes(output)
+
+            if any(__found(pattern) for pattern in stop_patterns):
+                return False, bytes(output)
+            for prompt, answer in (answers or {}).items():
+                if __found(prompt):
+                    time.sleep(2)
+                    serial_port.write(answer)
+            scanned = len(output)
+        return False, bytes(output)
+
+    def __read_available(self, port, timeout):
+        """等待串口数据到达(最长timeout秒)，返回当前已到达的全部数据，首字节到达即唤醒"""
+        serial_port = self.serial_ports[port]
+        try:
+            fd = serial_port.fileno()
+        except (OSError, io.UnsupportedOperation):
+            # Windows下串口没有文件描述符(select也不支持串口句柄)，退回in_waiting轮询
+            fd = None
+        if fd is not None:
+            select.select([fd], [], [], max(0, timeout))
+        else:
+            deadline = time.time() + timeout
+            while not serial_port.in_waiting and time.time() < deadline:
+                time.sleep(0.01)
+        return serial_port.read(serial_port.in_waiting)
+
     def __xmodem_get_data(self, size, timeout=1, port=None):
-        return self.serial_ports[port].read(size) or None
+        # read(size)可能在凑满size字节前提前返回，循环读取直到读满或超时，避免XMODEM因短读而NAK重传
+        # 串口超时已在传输开始时设置为_XMODEM_READ_TIMEOUT，这里不再修改(每次修改都会重新配置串口)，只检查截止时间
+        serial_port = self.serial_ports[port]
+        buffer = bytearray()
+        deadline = time.monotonic() + timeout
+        while len(buffer) < size and time.monotonic() < deadline:
+            buffer += serial_port.read(size - len(buffer))
+        return bytes(buffer) or None
 
     def __xmodem_put_data(self, data, timeout=1, port=None):
+        # 不在每个包后flush，包与包之间不留空闲；整个镜像发送完成后再统一flush
         return self.serial_ports[port].write(data) or None
 
     def __device_run_uart_start(self, uart_opt):
@@ -133,34 +291,20 @@ class Uartboot:
                 self.serial_ports["mcu"].reset_input_buffer()
                 self.serial_ports["mcu"].reset_output_buffer()
 
-                # 发送回车并检测响应
-                consecutive_C_count = 0
-                for attempt in range(5):  # 尝试5次
-                    self.serial_ports["mcu"].write(b'\n')
-                    time.sleep(0.3)
-
-                    # 读取响应
-                    response = self.serial_ports["mcu"].read_all()
-                    if response:
-                        try:
-                            response_str = response.decode('utf-8', 'ignore')
-                        except:
-                            response_str = str(response)
-
-                        self.logger.debug(f"MCU响应 (尝试{attempt+1}): {repr(response)} -> {repr(response_str)}")
-
-                        # 检查是否收到C字符（UART模式的标志）
-                        if response == b'C' or response_str.strip() == 'C' or 'CCC' in response_str:
-                            consecutive_C_count += 1
-                            if consecutive_C_count >= 2:  # 连续收到2个C确认
-                                self.logger.info("MCU已处于UART模式")
-                                return True
-                        else:
-                            consecutive_C_count = 0
-                            # 如果收到其他提示符，说明在shell模式
-                            if any(prompt in response_str for prompt in ['horizon:/', '#', '$', 'root@']):
-                                self.logger.info("MCU处于shell模式，需要进入UART模式")
-                                return False
+                # 发送回车并等待'CCC'（UART模式的标志），最长1.5秒
+                found, response = self.__wait_for_ccc(
+                    "mcu", time.time() + 1.5, poke=True, stop_patterns=self._SHELL_PROMPTS
+                )
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"MCU响应: {repr(response)}")
+                if found:
+                    self.logger.info("MCU已处于UART模式")
+                    return True
+
+                # 如果收到其他提示符，说明在shell模式
+                if any(prompt in response for prompt in self._SHELL_PROMPTS):
+                    self.logger.info("MCU处于shell模式，需要进入UART模式")
+                    return False
 
             except Exception as e:
                 self.logger.error(f"检查UART模式时出错: {e}")
@@ -223,15 +367,14 @@ class Uartboot:
                     self.logger.info("=" * 60)
 
                     try:
-                        # 使用subprocess.Popen实时显示输出
+                        # 使用subprocess.Popen实时显示输出，子进程关闭输出缓冲
                         process = subprocess.Popen(
                             cmd,
                             stdout=subprocess.PIPE,
                             stderr=subprocess.STDOUT,  # 合并stderr到stdout
-                            text=True,
-                            bufsize=1,  # 行缓冲
-                            universal_newlines=True,
-                            cwd=script_dir
+                            bufsize=0,
+                            cwd=script_dir,
+                            env={**os.environ, "PYTHONUNBUFFERED": "1"},
                         )
 
                         output_lines = []
@@ -248,35 +391,51 @@ class Uartboot:
                             "MCU unlock process completed successfully": "MCU解锁完成!"
                         }
 
-                        # 实时读取输出
-                        while True:
-                            output = process.stdout.readline()
-                            if output == '' and process.poll() is not None:
-                                break
-                            if output:
-                                output = output.strip()
-                                output_lines.append(output)
-
-                                # 检查是否匹配已知的解锁步骤
-                                step_matched = False
-                                for keyword, progress_msg in unlock_steps.items():
-                                    if keyword in output:
-                                        self.logger.info(f"  {progress_msg}")
-                                        step_matched = True
-                                        break
-
-                                # 如果没有匹配到步骤，显示原始输出（但过滤掉一些冗余信息）
-                                if not step_matched and output:
-                                    # 过滤掉一些冗余的调试信息
-                                    if not any(skip in output.lower() for skip in [
-                                        'debug', 'write mcu serial command: shell_cmd_',
-                                        'read serial data is', '- info -', '- debug -'
-                                    ]):
-                                        # 只显示重要信息
-                                        if any(important in output.lower() for important in [
-                                            'error', 'failed', 'success', 'complete', 'unlock'
-                                        ]):
-                                            self.logger.info(f"{output}")
+                        # 冗余的调试信息及需要显示的重要信息关键字
+                        skip_keywords = (
+                            'debug', 'write mcu serial command: shell_cmd_',
+                            'read serial data is', '- info -', '- debug -'
+                        )
+                        important_keywords = ('error', 'failed', 'success', 'complete', 'unlock')
+
+                        def __handle_line(line):
+                            output = line.decode('utf-8', 'ignore').strip()
+                            output_lines.append(output)
+
+                            # 检查是否匹配已知的解锁步骤
+                            for keyword, progress_msg in unlock_steps.items():
+                                if keyword in output:
+                                    self.logger.info(f"  {progress_msg}")
+                                    return
+
+                            # 如果没有匹配到步骤，只显示重要信息（过滤掉冗余的调试信息）
+                            output_lower = output.lower()
+                            if (
+                                output
+                                and not any(skip in output_lower for skip in skip_keywords)
+                                and any(important in output_lower for important in important_keywords)
+                            ):
+                                self.logger.info(f"{output}")
+
+                        # 非阻塞读取输出，数据到达即处理，子进程未换行的输出不会阻塞读取
+                        stdout_fd = process.stdout.fileno()
+                        os.set_blocking(stdout_fd, False)
+                        pending = b''
+                        with selectors.DefaultSelector() as selector:
+                            selector.register(stdout_fd, selectors.EVENT_READ)
+                            while True:
+                                selector.select()
+                                try:
+                                    data = os.read(stdout_fd, 65536)
+                                except BlockingIOError:
+                                    continue
+                                if not data:
+                                    break
+                                *lines, pending = (pending + data).split(b'\n')
+                                for line in lines:
+                                    __handle_line(line)
+                        if pending:
+                            __handle_line(pending)
 
                         # 等待进程完成
                         return_code = process.wait()
@@ -416,7 +575,7 @@ class Uartboot:
                 # 兼容mcureboot命令与mcureset命令
                 _, output = mcu_serial.send_cmd('mcureboot\nmcureset' + 16 * '\n', 2, self.state_config['prompts']['mcu'], 0.05)
                 self.logger.debug(f'mcu serial port output:\n{output}')
-                if re.findall("CCC", output):
+                if "CCC" in output:
                     return True
 
             return False
@@ -430,12 +589,13 @@ class Uartboot:
 
             # 如果不在UART模式，等待用户手动操作
             self.logger.info("请手动操作设备进入UART模式（等待'C'字符）...")
-            output = self.serial_ports["mcu"].read_until(b"CCC")
-            self.logger.debug(
-                f"while waiting for device run into uart download mode, serial port output:\n"
-                f'{output.decode("utf-8", "ignore")}'
-            )
-            if not output:
+            found, output = self.__wait_for_ccc("mcu", time.time() + self.serial_ports["mcu"].timeout)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(
+                    f"while waiting for device run into uart download mode, serial port output:\n"
+                    f'{output.decode("utf-8", "ignore")}'
+                )
+            if not found:
                 self.logger.error(
                     f'timeout waiting for \'CCC\' in {self.serial_ports["mcu"].timeout} second'
                 )
@@ -473,25 +633,18 @@ class Uartboot:
                 "project-snapshot-local/Dev/Common/j6/bsp/daily/Release/"
                 #"project-snapshot-local/NGX/Lite/Demo/BSW/bsp/J6/daily/Release/"
             )
-            device_to_sdk_map = list(self.board_config.keys())
-
-            for match in device_to_sdk_map:
-                if board_sample == match['device']:
-                    target_sdk_version = match['sdk']
-                    break
-            else:
-                target_sdk_version = 930
+            target_sdk_version = self.device_to_sdk_map.get(board_sample, 930)
 
             # 使用jfrog api查询最新包的url
             jfrog_package_dir = f'{jfrog_api_prefix}/{jfrog_bsp_package}/{target_sdk_version}'
-            response = requests.get(jfrog_package_dir, params={'lastModified': ''})
+            response = self._http.get(jfrog_package_dir, params={'lastModified': ''}, timeout=30)
             if response.status_code != HTTPStatus.OK:
                 self.logger.error(f'{response.status_code}:\n{response.text}')
                 return False
 
             # 查询到最新包的信息
             jfrog_latest_bsp_package_info_url = response.json()['uri']
-            response = requests.get(jfrog_latest_bsp_package_info_url)
+            response = self._http.get(jfrog_latest_bsp_package_info_url, timeout=30)
             if response.status_code != HTTPStatus.OK:
                 self.logger.error(f'{response.status_code}:\n{response.text}')
                 return False
@@ -502,7 +655,7 @@ class Uartboot:
             self.logger.info(f'latest bsp package url: {latest_bsp_package_url}')
             return latest_bsp_package_url, latest_bsp_package_size, latest_bsp_package_md5
 
-        def __check_latest_package(ota_package_path, latest_bsp_package_size, latest_bsp_package_md5) -> bool:
+        def __check_latest_package(ota_package_path, cur_md5, latest_bsp_package_size, latest_bsp_package_md5) -> bool:
             # 文件大小判断
             cur_size = os.path.getsize(ota_package_path)
             if cur_size != latest_bsp_package_size:
@@ -510,12 +663,7 @@ class Uartboot:
                 return False
             self.logger.info(f'bsp package size validate pass')
 
-            # 文件完整性判断
-            md5 = hashlib.md5()
-            with open(ota_package_path, 'rb') as file:
-                for chunk in iter(lambda: file.read(1024 * 1024), b''):
-                    md5.update(chunk)
-            cur_md5 = md5.hexdigest()
+            # 文件完整性判断，md5已在下载过程中计算
             if cur_md5 != latest_bsp_package_md5:
                 self.logger.error(f'invalid bsp package md5, actual: {cur_md5}, expect: {latest_bsp_package_md5}')
                 return False
@@ -524,7 +672,13 @@ class Uartboot:
             return True
 
         if url == 'latest':
-            package_url, package_size, package_md5 = __get_latest_package_info(board_sample)
+            package_info = retry(
+                self.logger, 5, lambda: __get_latest_package_info(board_sample), 'query latest bsp package info',
+                backoff=True,
+            )
+            if not package_info:
+                return False, ''
+            package_url, package_size, package_md5 = package_info
         else:
             package_url = url
 
@@ -532,37 +686,22 @@ class Uartboot:
         package_dir = '/tmp'
         package_path = f'{package_dir}/{package_name}'
 
-        # 下载最新的升级包
-        cur_pwd = os.getcwd()
-        os.chdir(package_dir)
-        max_retry_times = 10
-        for retry_times in range(max_retry_times):
-            try:
-                subprocess.run(
-                    f'wget -c --tries=10 --retry-connrefused --timeout=30 --waitretry=10 {package_url}',
-                    shell=True,
-                    timeout=self.download_timeout,
-                    text=True,
-                    check=True
-                )
-                self.logger.info(f'succeed download latest bsp package {package_path}')
-                break
-            except Exception as e:
-                retry_times += 1
-                self.logger.warning(f'failed to download {package_name} for {retry_times} times\n{e}')
-                if os.path.exists(package_path):
-                    os.remove(package_path)
-        else:
-            os.chdir(cur_pwd)
-            self.logger.error(
-                f"failed download latest bsp package after retry {max_retry_times} times"
-            )
+        # 下载最新的升级包，失败时保留已下载部分用于续传
+        cur_md5 = retry(
+            self.logger,
+            10,
+            lambda: fetch_package(self._http.get, package_url, package_path, hashlib.md5, self.download_timeout),
+            f'download {package_name}',
+            backoff=True,
+        )
+        if not cur_md5:
             return False, ""
+        self.logger.info(f'succeed download latest bsp package {package_path}')
 
-        os.chdir(cur_pwd)
-
-        if url == 'latest' and not __check_latest_package(package_path, package_size, package_md5):
+        if url == 'latest' and not __check_latest_package(package_path, cur_md5, package_size, package_md5):
             self.logger.error(f'download latest package but check failed')
+            # 删除校验失败的包，避免下次续传到损坏的文件上
+            os.remove(package_path)
             return False, ''
 
         return True, package_path
@@ -580,11 +719,8 @@ class Uartboot:
 
         if flag:
             self.logger.info(f'need download mcu images')
-            for match in mcu_package:
-                if board_sample == match['device']:
-                    package_url = match['sdk']
-                    break
-            else:
+            package_url = {match['device']: match['sdk'] for match in mcu_package}.get(board_sample)
+            if package_url is None:
                 self.logger.error(
                     f"not fount suitable mcu sdk version for {board_sample} version board in config"
                 )
@@ -595,57 +731,65 @@ class Uartboot:
             package_path = f'{package_dir}/{package_name}'
 
             # 下载最新的升级包
-            cur_pwd = os.getcwd()
-            os.chdir(package_dir)
-            max_retry_times = 10
-            for retry_times in range(max_retry_times):
+            # 有aria2c时使用多连接分段下载，否则退回单连接的wget，两者均支持-c续传
+            if shutil.which('aria2c'):
+                download_cmd = [
+                    'aria2c', '-c', '-x8', '-s8', '--max-tries=10', '--retry-wait=10', '--timeout=30',
+                    '--auto-file-renaming=false', '--allow-overwrite=true', package_url
+                ]
+            else:
+                download_cmd = [
+                    'wget', '-c', '--tries=10', '--retry-connrefused', '--timeout=30', '--waitretry=10', package_url
+                ]
+
+            def __fetch_mcu_package():
                 try:
                     subprocess.run(
-                        f'wget -c --tries=10 --retry-connrefused --timeout=30 --waitretry=10 {package_url}',
-                        shell=True,
+                        download_cmd,
+                        cwd=package_dir,
                         timeout=self.download_timeout,
                         text=True,
                         check=True
                     )
-                    self.logger.info(f'succeed download latest mcu package {package_path}')
-                    break
-                except Exception as e:
-                    retry_times += 1
-                    self.logger.warning(f'failed to download {package_name} for {retry_times} times\n{e}')
+                except Exception:
                     if os.path.exists(package_path):
                         os.remove(package_path)
-            else:
-                os.chdir(cur_pwd)
-                self.logger.error(
-                    f"failed download latest bsp package after retry {max_retry_times} times"
-                )
-                return False, ""
+                    raise
+                return True
 
-            os.chdir(cur_pwd)
+            downloaded = retry(self.logger, 10, __fetch_mcu_package, f'download {package_name}', backoff=True)
+            if not downloaded:
+                return False
+            self.logger.info(f'succeed download latest mcu package {package_path}')
             try:
-                with zipfile.ZipFile(package_path, 'r') as zip_ref:
-                    zip_ref.extractall(self.img_packages)
+                extract_package(package_path, self.img_packages)
             except zipfile.BadZipFile as e:
                 self.logger.error(f'{e}')
                 return False
             self.logger.info(f'succeed unzip {package_path} to {self.img_packages}')
 
+            # 解压目录与目标目录在同一文件系统，直接移动，无需复制数据
             if os.path.exists(f'{self.img_packages}/IMG/SBL.img'):
-                shutil.copy2(f'{self.img_packages}/IMG/SBL.img', f'{self.img_packages}/SBL.img')
+                os.replace(f'{self.img_packages}/IMG/SBL.img', f'{self.img_packages}/SBL.img')
             else:
                 self.logger.error(f'there is no SBL.img in {self.img_packages}/IMG')
                 return False
 
             if os.path.exists(f'{self.img_packages}/BIN/J6_MCU_DEBUG.bin'):
-                shutil.copy2(f'{self.img_packages}/BIN/J6_MCU_DEBUG.bin', f'{self.img_packages}/J6_MCU_DEBUG.bin')
+                os.replace(f'{self.img_packages}/BIN/J6_MCU_DEBUG.bin', f'{self.img_packages}/J6_MCU_DEBUG.bin')
             else:
                 self.logger.error(f'there is no J6_MCU_DEBUG.bin in {self.img_packages}/BIN')
                 return False
 
-            mcu_firmware_dir = importlib.util.find_spec('cicd').submodule_search_locations[0] + "/config/mcu_firmware"
+            mcu_firmware_dir = _config_root() + "/config/mcu_firmware"
             if os.path.exists(mcu_firmware_dir):
-                for fw in os.listdir(mcu_firmware_dir):
-                    shutil.copy2(os.path.join(mcu_firmware_dir, fw), os.path.join(self.img_packages, fw))
+                # copyfile在Linux下走内核态sendfile，DirEntry复用目录遍历时的stat结果
+                with os.scandir(mcu_firmware_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            fw_path = os.path.join(self.img_packages, entry.name)
+                            shutil.copyfile(entry.path, fw_path)
+                            shutil.copystat(entry.path, fw_path)
             else:
                 self.logger.error(f'there is no mcu fw dir at {mcu_firmware_dir}')
                 return False
@@ -653,154 +797,132 @@ class Uartboot:
         return True
 
     def __host_run_uartboot(self, board, loading_step):
+        # 各步骤之间有先后依赖(mcu加载hsmfw后hsm才能接收，soc最后启动)，不能按端口并行传输，
+        # 传输开始前先解析全部镜像路径，缺少镜像时立即失败，而不是传输到一半才发现
+        # 一次遍历镜像目录得到全部可用镜像，代替逐个镜像的os.path.exists
+        with os.scandir(self.img_packages) as entries:
+            available_images = {entry.name: entry.path for entry in entries if entry.is_file()}
+
+        image_paths = {}
         for step in loading_step:
             for image in step["img_data"]:
-                if os.path.exists(os.path.join(self.img_packages, image)):
-                    image_path = os.path.join(self.img_packages, image)
-                elif image == 'hsmfw_se.pkg' and os.path.exists(os.path.join(self.img_packages, f'{board}-{image}')):
-                    image_path = os.path.join(self.img_packages, f'{board}-{image}')
+                if image in available_images:
+                    image_paths[image] = available_images[image]
+                elif image == 'hsmfw_se.pkg' and f'{board}-{image}' in available_images:
+                    image_paths[image] = available_images[f'{board}-{image}']
                 else:
                     self.logger.error(f'there is no {image} in {self.img_packages}')
                     return False
 
-                self.logger.info(f'it\'s going to load {image_path} in {step["uart_port"]} port')
+        for step in loading_step:
+            port = step["uart_port"]
+            serial_port = self.serial_ports[port]
+            xmodem = self.xmodem[port]
+            for image in step["img_data"]:
+                image_path = image_paths[image]
+                self.logger.info(f'it\'s going to load {image_path} in {port} port')
 
-                self.logger.info(f'waiting \'C\' for loading {image_path} in {step["uart_port"]} port')
+                self.logger.info(f'waiting \'C\' for loading {image_path} in {port} port')
 
                 # 区分soc和其他端口的检测方式
-                if step["uart_port"] == "soc":
-                    # soc端口：被动等待，不主动发回车
-                    time_limit = time.time() + 10  # soc端口等待10秒
-                    output = ""
-                    found_C = False
-                    consecutive_C_count = 0
-                    while time_limit > time.time():
-                        time.sleep(0.2)
-                        chunk = self.serial_ports[step["uart_port"]].read_all()
-                        try:
-                            chunk_str = chunk.decode("utf-8", "ignore")
-                        except Exception:
-                            chunk_str = str(chunk)
-                        output += chunk_str
-
-                        # 检查是否收到 'C' 或 'CCC'
-                        if chunk == b'C' or chunk_str.strip() == 'C' or 'CCC' in chunk_str:
-                            consecutive_C_count += 1
-                            if consecutive_C_count >= 1:  # 至少2个C
-                                found_C = True
-                                break
-                        else:
-                            consecutive_C_count = 0
+                if port == "soc":
+                    # soc端口：被动等待10秒，不主动发回车
+                    found_C, output = self.__wait_for_ccc(port, time.time() + 10)
                 else:
-                    # mcu和hsm端口：主动发回车检测
-                    time_limit = time.time() + 15
-                    output = ""
-                    found_C = False
-                    consecutive_C_count = 0
-                    while time_limit > time.time():
-                        self.serial_ports[step["uart_port"]].write("\n".encode())
-                        time.sleep(0.2)
-                        chunk = self.serial_ports[step["uart_port"]].read_all()
-                        try:
-                            chunk_str = chunk.decode("utf-8", "ignore")
-                        except Exception:
-                            chunk_str = str(chunk)
-                        output += chunk_str
-
-                        # 检测 SecureDebug 提示并延迟2秒后自动输入 0（不加回车）
-                        if "Please enter 1 or 0" in chunk_str:
-                            time.sleep(2)
-                            self.serial_ports[step["uart_port"]].write(b"0")
-                            time.sleep(0.2)
-
-                        # 检查是否连续收到 'C' 或 'CCC'
-                        if chunk == b'C' or chunk_str.strip() == 'C' or 'CCC' in chunk_str:
-                            consecutive_C_count += 1
-                            if consecutive_C_count >= 2:
-                                found_C = True
-                                break
-                        else:
-                            consecutive_C_count = 0
+                    # mcu和hsm端口：主动发回车检测，检测到 SecureDebug 提示时自动输入 0（不加回车）
+                    found_C, output = self.__wait_for_ccc(
+                        port,
+                        time.time() + 15,
+                        poke=True,
+                        answers=self._SECURE_DEBUG_ANSWERS,
+                    )
 
                 if not found_C:
                     self.logger.error(
-                        f'timeout waiting for consecutive \'C\' when send {image_path} at {step["uart_port"]} serial port in {self.serial_ports[step["uart_port"]].timeout} second'
+                        f'timeout waiting for consecutive \'C\' when send {image_path} at {port} serial port in {serial_port.timeout} second'
                     )
                     return False
 
+                # 镜像按包大小向上取整得到XMODEM包数
+                image_size = os.path.getsize(image_path)
+                packet_size = self.packet_size[self.xmodem_mode]
+                xmodem_packets_count = -(-image_size // packet_size)
+
                 with Progress(
                     TextColumn("[progress.description]{task.description}"),
                     BarColumn(complete_style="yellow", finished_style="green"),
                     TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
                     TimeRemainingColumn(),
                     TimeElapsedColumn(),
+                    refresh_per_second=10,
                 ) as progress:
-                    xmodem_packets_count = (
-                        (
-                            os.path.getsize(f"{image_path}")
-                            / self.packet_size[self.xmodem_mode]
-                        )
-                        if os.path.getsize(f"{image_path}")
-                        % self.packet_size[self.xmodem_mode]
-                        == 0
-                        else int(
-                            os.path.getsize(f"{image_path}")
-                            / self.packet_size[self.xmodem_mode]
-                        )
-                        + 1
-                    )
                     progress_task = progress.add_task(
-                        description="{:<30}".format(f"loading {image}..."),
+                        description=f"loading {image}...".ljust(30),
                         total=xmodem_packets_count,
                     )
 
+                    # 每个包只更新计数，由rich的自动刷新线程按固定频率重绘，不阻塞串口发送
                     def uart_load_progress_callback(_total_packets, _success_count, _error_count):
-                        progress.update(progress_task, advance=1, refresh=True)
-
-                    with open(f'{image_path}', 'rb') as stream:
-                        if not self.xmodem[step["uart_port"]].send(
-                            stream,
-                            timeout=60,
-                            quiet=True,
-                            callback=uart_load_progress_callback,
-                        ):
-                            self.logger.error(f'failed to load {image_path} in {step["uart_port"]} port')
-                            progress.stop()
-                            return False
+                        progress.update(progress_task, advance=1)
+
+                    # 整个传输只设置一次串口读超时，getc内部不再逐次修改
+                    saved_timeout = serial_port.timeout
+                    serial_port.timeout = self._XMODEM_READ_TIMEOUT
+                    try:
+                        # 1MB读缓冲，XMODEM每次读取一个包时直接从缓冲区复制，不必每包一次read系统调用
+                        with open(image_path, 'rb', buffering=1024 * 1024) as stream:
+                            if not xmodem.send(
+                                stream,
+                                timeout=60,
+                                quiet=True,
+                                callback=uart_load_progress_callback,
+                            ):
+                                self.logger.error(f'failed to load {image_path} in {port} port')
+                                progress.stop()
+                                return False
 
-                        progress.stop()
+                            serial_port.flush()
+                            progress.stop()
+                    finally:
+                        serial_port.timeout = saved_timeout
+                # 最多1秒内整块读出发送完成后残留的串口输出
                 end_read_timeout = time.time() + 1
-                end_read_output = ""
-                while (
-                    self.serial_ports[step["uart_port"]].in_waiting and end_read_timeout
-                ):
-                    end_read_output += (
-                        self.serial_ports[step["uart_port"]]
-                        .read()
-                        .decode("utf-8", "ignore")
+                end_read_output = bytearray()
+                while time.time() < end_read_timeout and serial_port.in_waiting:
+                    end_read_output += serial_port.read(serial_port.in_waiting)
+                # 串口输出可能有数KB，未开启debug日志时不做解码和格式化
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(
+                        f'after loading {image_path} in {port} port, serial port output:\n'
+                        f'{end_read_output.decode("utf-8", "ignore")}'
                     )
-                self.logger.debug(
-                    f'after loading {image_path} in {step["uart_port"]} port, serial port output:\n{end_read_output}'
-                )
 
         self.logger.info(f'waiting for SoC run into uboot mode')
         content = ''
         time_limit = time.time() + self.serial_ports["soc"].timeout
+        # 先发送一次回车，之后只在串口0.5秒无输出时再补发(仍能打断uboot自动启动倒计时)，不在输出期间持续发送
+        self.serial_ports["soc"].write(b"\n")
+        next_poke_time = time.time() + 0.5
         while True:
             if time.time() > time_limit:
                 self.logger.error(f"SoC进入uboot超时")
                 break
 
-            self.serial_ports["soc"].write("\n".encode())
+            if time.time() >= next_poke_time:
+                self.serial_ports["soc"].write(b"\n")
+                next_poke_time = time.time() + 0.5
 
-            output = self.serial_ports["soc"].read_all().decode("utf-8", "ignore")
+            data = self.__read_available("soc", next_poke_time - time.time())
+            if data:
+                next_poke_time = time.time() + 0.5
+            output = data.decode("utf-8", "ignore")
+            # 只在新读到的数据(及与上次数据衔接处)中查找提示符
+            scan_start = max(0, len(content) - self._uboot_prompt_len)
             content += output
 
-            if any(
-                len(re.findall(prompt, content, re.IGNORECASE)) > 0
-                for prompt in self.state_config["prompts"]["uboot"]
-            ):
-                self.logger.debug(f'soc serial port output:\n{content}')
+            if self._uboot_prompt_re.search(content, scan_start):
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f'soc serial port output:\n{content}')
                 self.logger.info(f"SoC已进入uboot")
 
                 # 进入uboot后，发送fastboot udp命令
@@ -808,19 +930,19 @@ class Uartboot:
                 self.serial_ports["soc"].write("fastboot udp\n".encode())
 
                 # 等待fastboot命令执行完成并解析IP地址
-                fastboot_content = ''
+                fastboot_content = bytearray()
                 fastboot_time_limit = time.time() + 30  # 等待30秒
                 board_ip = None
 
                 while time.time() < fastboot_time_limit:
-                    time.sleep(0.5)
-                    output = self.serial_ports["soc"].read_all().decode("utf-8", "ignore")
-                    fastboot_content += output
+                    # 从上次数据末尾前一个匹配长度处开始查找，已查找过的数据不再重复扫描
+                    scan_start = max(0, len(fastboot_content) - _FASTBOOT_IP_MAX_LEN)
+                    fastboot_content += self.__read_available("soc", fastboot_time_limit - time.time())
 
                     # 查找IP地址模式，例如: "Listening for fastboot command on 192.168.2.62"
-                    ip_match = re.search(r"Listening for fastboot command on (\d+\.\d+\.\d+\.\d+)", fastboot_content)
+                    ip_match = _FASTBOOT_IP_RE.search(fastboot_content, scan_start)
                     if ip_match:
-                        board_ip = ip_match.group(1)
+                        board_ip = ip_match.group(1).decode()
                         self.logger.info(f"板卡IP地址: {board_ip}")
                         print(f"板卡IP地址: {board_ip}")
                         break
@@ -829,25 +951,22 @@ class Uartboot:
                     self.logger.info(f"成功进入fastboot模式，板卡IP: {board_ip}")
                 else:
                     self.logger.warning("未能获取到板卡IP地址")
-                    self.logger.debug(f"fastboot命令输出:\n{fastboot_content}")
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug(f"fastboot命令输出:\n{fastboot_content.decode('utf-8', 'ignore')}")
 
                 return True
 
-            time.sleep(0.2)
-
         self.logger.error(f'SoC failed run into uboot mode, output:\n{content}')
         return False
 
     def boot(self, link: str = None, board: str = None, uart_opt: str = None):
         self.logger.info(f"it's going to run uartboot, link: {link}, board: {board}")
 
-        for boot_method in self.boot_config['uart_boot_methods']:
-            if board in list(self.board_config.keys()):
-                uart_boot_method = boot_method
-                break
-        else:
+        if board not in self.board_config:
             self.logger.error(f"board: {board}, is not supported to boot by this tool")
             return False
+        # uart_boot.json中的启动方式不区分板卡，所有支持的板卡均使用第一个
+        uart_boot_method = self.boot_config['uart_boot_methods'][0]
 
         if not self.__device_run_uart_start(uart_opt):
             return False
@@ -858,8 +977,7 @@ class Uartboot:
                 self.img_packages = os.path.join(link)
                 self.logger.info(f"using img package: {self.img_packages}")
             else:
-                if not os.path.exists(self.img_packages):
-                    os.makedirs(self.img_packages)
+                os.makedirs(self.img_packages, exist_ok=True)
 
                 # 指定ota包路径升级
                 if os.path.isfile(link):
@@ -876,8 +994,7 @@ class Uartboot:
                 self.logger.info(f"using ota package: {ota_package_path}")
 
                 try:
-                    with zipfile.ZipFile(ota_package_path, "r") as zip_ref:
-                        zip_ref.extractall(self.img_packages)
+                    extract_package(ota_package_path, self.img_packages)
                 except zipfile.BadZipFile as e:
                     self.logger.error(f"{e}")
                     return False
@@ -886,7 +1003,8 @@ class Uartboot:
                 )
         else:
             for path in glob.glob(f'./out/release*/target/product/img_packages'):
-                if re.findall(rf'./out/release.*/target/product/img_packages', path) and os.path.isdir(path):
+                # glob已按模式筛选过路径，只需确认是目录
+                if os.path.isdir(path):
                     self.img_packages = path
                     self.logger.info(f'not force to get ota package, try to use images in {self.img_packages}')
                     break
@@ -911,23 +1029,12 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
 
-    try:
-        config_root_path = importlib.util.find_spec('cicd').submodule_search_locations[
-            0
-        ]
-    except Exception:
-        config_root_path = "."
-    board_config = json.loads(
-        open(config_root_path + "/config/device/board.json", "rb")
-        .read()
-        .decode("utf-8")
-    )
+    config_root_path = _config_root()
+    board_config = _load_json(config_root_path + "/config/device/board.json")
     device_config_path = "/dev/serial/by-name/cicd-vw/device.json"
     default_board_type = None
     if os.path.exists(device_config_path):
-        device_config = json.loads(
-            open(device_config_path, "rb").read().decode("utf-8")
-        )
+        device_config = _load_json(device_config_path)
         default_board_type = device_config.get("hostname", None)
 
     support_boards = list(board_config.keys())